@@ -0,0 +1,236 @@
+"""
+Benchmarks for the conversion and playback pipeline.
+
+A synthetic corpus is generated for every case (MIDI files with a given note
+count, polyphony, track count, PPQ and number of tempo changes, AMK style MML
+with nested and labeled loops, and ArduPilot melodies). Each pipeline stage is
+timed on its own, the best of several repetitions is kept.
+
+Results are written as JSON. With --baseline the run is compared against a
+stored result and the exit code is 1 if any stage got slower than the
+threshold allows.
+
+    python benchmark.py -o baseline.json
+    python benchmark.py --baseline baseline.json --threshold 0.25
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+
+import mido
+
+import conv_mid
+import mml_duration
+
+CASES = {
+    "small": dict(notes=2000, polyphony=2, tracks=2, ppq=96, tempo_changes=2, loops=50),
+    "medium": dict(notes=20000, polyphony=4, tracks=4, ppq=480, tempo_changes=10, loops=400),
+}
+
+STAGES = [
+    "read_midi",
+    "read_midi_numpy",
+    "prepare_midi_channels",
+    "channel_to_mml",
+    "read_mml",
+    "commands_to_table",
+    "table_to_midi",
+    "segment_mml",
+    "segment_times",
+]
+
+PITCHES = ["c", "c+", "d", "d+", "e", "f", "f+", "g", "g+", "a", "a+", "b"]
+
+
+def generate_midi(path, notes=2000, polyphony=2, tracks=2, ppq=96, tempo_changes=2, seed=0):
+    """
+    Writes a type 1 MIDI file with a tempo track and the given number of note
+    tracks. notes is the number of notes per track, up to polyphony notes are
+    started at the same time.
+    """
+    rng = random.Random(seed)
+    mid = mido.MidiFile(ticks_per_beat=ppq)
+    tempo_track = mido.MidiTrack()
+    tempo_track.append(mido.MetaMessage("set_tempo", tempo=500000, time=0))
+    for _ in range(tempo_changes):
+        tempo_track.append(mido.MetaMessage("set_tempo", tempo=rng.randint(300000, 800000), time=ppq*16))
+    mid.tracks.append(tempo_track)
+    lengths = [ppq//4, ppq//2, ppq, 2*ppq]
+    for k in range(tracks):
+        track = mido.MidiTrack()
+        track.append(mido.MetaMessage("track_name", name=f"track {k}", time=0))
+        events = list()
+        tick = 0
+        while len(events) < 2*notes:
+            length = rng.choice(lengths)
+            for voice in range(rng.randint(1, polyphony)):
+                key = rng.randint(48, 84) - 5*voice
+                events.append((tick, 1, key))
+                events.append((tick + length, 0, key))
+            tick += rng.choice(lengths)
+        events.sort(key=lambda e: (e[0], e[1]))
+        last = 0
+        for tick, on, key in events:
+            track.append(mido.Message("note_on", note=key, velocity=80 if on else 0, time=tick-last))
+            last = tick
+        mid.tracks.append(track)
+    mid.save(path)
+
+
+def generate_mml(path, loops=50, channels=4, seed=0):
+    """
+    Writes an AMK style MML file. Every channel consists of loops phrases made
+    of super loops, nested loops and calls of a labeled loop.
+    """
+    rng = random.Random(seed)
+    lines = ["#amk 2", "t60"]
+    for i in range(channels):
+        phrase = lambda n: "".join(f"{rng.choice(PITCHES)}{rng.choice([4, 8, 16])}" for _ in range(n))
+        body = [f"#{i} @{i} o{rng.randint(3, 5)} (1{i})[{phrase(8)}]2"]
+        for _ in range(loops):
+            body.append(f"[[{phrase(2)} [{phrase(4)}]{rng.randint(2, 4)} (1{i}){rng.randint(1, 3)} > {phrase(2)} <]]2 r8")
+        lines.append(" ".join(body))
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def generate_melody(notes=2000, seed=0):
+    """
+    Returns an ArduPilot MML melody with the given number of notes and rests.
+    """
+    rng = random.Random(seed)
+    parts = list()
+    for _ in range(notes):
+        if rng.random() < 0.1:
+            parts.append(rng.choice(["<", ">"]))
+        parts.append(f"{rng.choice(PITCHES + ['r'])}{rng.choice([4, 8, 16])}{'.' if rng.random() < 0.1 else ''}")
+    return "".join(parts)
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    """
+    Runs func repeat times with its console output suppressed. Returns the
+    best wall time in seconds and the result of the last run.
+    """
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_case(params, workdir, repeat=3):
+    """
+    Generates the corpus of one case and times every stage. Returns a dict
+    stage -> seconds.
+    """
+    import play_tune
+
+    midi_file = os.path.join(workdir, "corpus.mid")
+    mml_file = os.path.join(workdir, "corpus.mml")
+    generate_midi(midi_file, params["notes"], params["polyphony"], params["tracks"],
+                  params["ppq"], params["tempo_changes"])
+    generate_mml(mml_file, params["loops"])
+    melody = generate_melody(params["notes"])
+
+    results = dict()
+    results["read_midi"], (channels, names, tempo, PPQ) = timed(conv_mid.read_midi, midi_file, repeat=repeat)
+    results["read_midi_numpy"], _ = timed(conv_mid.read_midi, midi_file, reader="numpy", repeat=repeat)
+    results["prepare_midi_channels"], (channels, names, _) = timed(
+        conv_mid.prepare_midi_channels, channels, names, repeat=repeat)
+    channels = conv_mid.channel_length(channels, PPQ)
+    results["channel_to_mml"], _ = timed(
+        lambda: sum(len(chunk) for chunk in conv_mid.channel_to_mml(channels, names, 48)), repeat=repeat)
+
+    results["read_mml"], mml_channels = timed(conv_mid.read_mml, mml_file, repeat=repeat)
+    results["commands_to_table"], table = timed(conv_mid.commands_to_table, mml_channels, repeat=repeat)
+    results["table_to_midi"], _ = timed(
+        conv_mid.table_to_midi, table, os.path.join(workdir, "table.mid"), repeat=repeat)
+
+    results["segment_mml"], segments = timed(
+        play_tune.segment_mml, melody, play_tune.MAX_CHUNK_LENGTH, "t120", repeat=repeat)
+    # time the parsing, not the cache
+    results["segment_times"], _ = timed(
+        lambda: mml_duration.segment_duration.cache_clear() or mml_duration.segment_times(segments), repeat=repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change of every stage against the baseline. Returns the list
+    of (case, stage) which got slower than threshold allows.
+    """
+    regressions = list()
+    for case, stages in results["results"].items():
+        for stage, seconds in stages.items():
+            base = baseline["results"].get(case, {}).get(stage)
+            if base is None:
+                continue
+            change = (seconds - base) / base if base > 0 else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions.append((case, stage))
+            print(f"{case:>8} {stage:<24} {base:9.4f} s -> {seconds:9.4f} s ({change:+7.1%}){flag}")
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the conversion and playback pipeline.")
+    parser.add_argument("--case", action="append", choices=sorted(CASES), help="case to run, may be repeated (default: all)")
+    parser.add_argument("--notes", type=int, help="run a custom case with this many notes per track")
+    parser.add_argument("--polyphony", type=int, default=2)
+    parser.add_argument("--tracks", type=int, default=2)
+    parser.add_argument("--ppq", type=int, default=96)
+    parser.add_argument("--tempo-changes", type=int, default=2)
+    parser.add_argument("--loops", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per stage, the best one counts")
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    if args.notes:
+        cases = {"custom": dict(notes=args.notes, polyphony=args.polyphony, tracks=args.tracks, ppq=args.ppq,
+                                tempo_changes=args.tempo_changes, loops=args.loops)}
+    else:
+        cases = {name: CASES[name] for name in (args.case or CASES)}
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cases": cases,
+        },
+        "results": dict(),
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, params in cases.items():
+            results["results"][name] = run_case(params, workdir, args.repeat)
+            for stage in STAGES:
+                print(f"{name:>8} {stage:<24} {results['results'][name][stage]:9.4f} s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
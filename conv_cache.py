@@ -0,0 +1,185 @@
+"""
+Content-addressed on-disk cache for conv_mid.
+
+Entries are keyed by the SHA-256 of the input file plus the conversion
+parameters, so changing a file or a parameter never hits a stale entry. Two
+kinds of entries are stored:
+
+  - the parsed tracks of a MIDI file (the result of read_midi) as an
+    uncompressed .npz archive, one array per column and track
+  - final conversion results (MML or MIDI files), copied as they are
+
+The cache is limited in size. Whenever something is stored, the least
+recently used entries are removed until the cache fits again; a hit counts as
+a use.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mml-ardupilot")
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Bump this whenever the cached data of conv_mid changes its meaning.
+CACHE_VERSION = 3
+
+TEMPO_COLUMNS = ("tempo", "ticks_abs")
+
+
+class ConversionCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def digest(self, filename):
+        """
+        Returns the SHA-256 of a file. Hash a file once and pass the digest
+        to digest_key when it needs several keys.
+        """
+        digest = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def key(self, filename, **params):
+        """
+        Returns the cache key of a file converted with the given parameters.
+        """
+        return self.digest_key(self.digest(filename), **params)
+
+    def digest_key(self, digest, **params):
+        """
+        Returns the cache key of a file with the given digest (see digest),
+        converted with the given parameters.
+        """
+        params["version"] = CACHE_VERSION
+        key = hashlib.sha256(digest.encode())
+        key.update(json.dumps(params, sort_keys=True).encode())
+        return key.hexdigest()
+
+    def load_tracks(self, key):
+        """
+        Returns (channels, names, tempo, PPQ) as stored by store_tracks, or
+        None if the entry does not exist.
+        """
+        path = self._hit(f"{key}.npz")
+        if path is None:
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            names = data["names"].tolist()
+            channels = list()
+            for i in range(len(names)):
+                columns = data[f"track{i}/columns"].tolist()
+                channels.append(pd.DataFrame({c: data[f"track{i}/{c}"] for c in columns}))
+            tempo = pd.DataFrame({c: data[f"tempo/{c}"] for c in TEMPO_COLUMNS})
+            PPQ = int(data["PPQ"])
+        return channels, names, tempo, PPQ
+
+    def store_tracks(self, key, channels, names, tempo, PPQ):
+        """
+        Stores the result of read_midi under the given key.
+        """
+        arrays = {
+            "names": np.array(names, dtype=str),
+            "PPQ": np.array(PPQ),
+        }
+        for column in TEMPO_COLUMNS:
+            arrays[f"tempo/{column}"] = tempo[column].to_numpy()
+        for i, channel in enumerate(channels):
+            arrays[f"track{i}/columns"] = np.array(channel.columns, dtype=str)
+            for column in channel.columns:
+                values = channel[column].to_numpy()
+                if values.dtype == object:
+                    values = values.astype(str)
+                arrays[f"track{i}/{column}"] = values
+        self._store(f"{key}.npz", lambda f: np.savez(f, **arrays))
+
+    def load_file(self, key, output):
+        """
+        Copies a cached conversion result to output. Returns False if the
+        entry does not exist.
+        """
+        path = self._hit(f"{key}.out")
+        if path is None:
+            return False
+        shutil.copyfile(path, output)
+        return True
+
+    def store_file(self, key, filename):
+        """
+        Stores a copy of a conversion result under the given key.
+        """
+        def write(f):
+            with open(filename, "rb") as src:
+                shutil.copyfileobj(src, f)
+        self._store(f"{key}.out", write)
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def size(self):
+        return sum(size for mtime, size, path in self._entries())
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is not
+        larger than max_size.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        # (last use, size, path) of every entry, other processes may remove
+        # entries at any time
+        entries = list()
+        if not os.path.isdir(self.directory):
+            return entries
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _hit(self, name):
+        path = os.path.join(self.directory, name)
+        try:
+            # the modification time marks the last use
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def _store(self, name, write):
+        # write to a temporary file first, so parallel conversions never see
+        # half written entries
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, os.path.join(self.directory, name))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
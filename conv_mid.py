@@ -1,13 +1,37 @@
+import os
+import re
 import sys
+import glob
+import time
+import struct
 import getopt
+import logging
+import heapq
+import functools
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import mido
 import pandas as pd
 import numpy as np
 
+from mml_lexer import iter_tokens
+from conv_cache import ConversionCache, DEFAULT_CACHE_DIR
+from tempo_map import TempoMap
+from smf_reader import read_smf
+from profiling import profiler
+
+log = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+# Size of the buffer used for writing the generated MML.
+WRITE_BUFFER_SIZE = 1 << 16
+
 
 def main(argv):
     try:
-        opts, args = getopt.getopt(argv, "hi:o:p:b:", ["help", "input=", "output=", "readable-midi", "group-by="])
+        opts, args = getopt.getopt(argv, "hi:o:p:g:j:vq", ["help", "input=", "output=", "ppq=", "readable-midi", "group-by=", "batch=", "jobs=", "no-cache", "clear-cache", "cache-dir=", "verbose", "quiet", "profile", "reader="])
     except getopt.GetoptError as err:
         print(err)
         usage()
@@ -17,6 +41,14 @@ def main(argv):
     midi_to_text = False
     ppq = 48
     group_by = "instrument"
+    batch = ""
+    jobs = None
+    use_cache = True
+    clear_cache = False
+    cache_dir = DEFAULT_CACHE_DIR
+    log_level = logging.INFO
+    profile = False
+    reader = "mido"
     for o, a in opts:
         if o in ("-h", "--help"):
             usage()
@@ -31,39 +63,208 @@ def main(argv):
             midi_to_text = True
         elif o in ("-g", "--group-by"):
             group_by = a
+        elif o in ("--batch"):
+            batch = a
+        elif o in ("-j", "--jobs"):
+            jobs = int(a)
+        elif o == "--no-cache":
+            use_cache = False
+        elif o == "--clear-cache":
+            clear_cache = True
+        elif o == "--cache-dir":
+            cache_dir = a
+        elif o in ("-v", "--verbose"):
+            log_level = logging.DEBUG
+        elif o in ("-q", "--quiet"):
+            log_level = logging.WARNING
+        elif o == "--profile":
+            profile = True
+        elif o == "--reader":
+            reader = a
         else:
             assert False, "unhandled option"
-    if input.endswith(".midi") or input.endswith(".mid"):
-        (channels, names, tempo, PPQ) = read_midi(input, midi_to_text)
-        channels, names, leftovers = prepare_midi_channels(channels, names)
-        print('channels', len(channels))
-        channels = channel_length(channels, PPQ)
-        cmds = channel_to_mml(channels, names, ppq)
-        with open(output, "w") as f:
-            f.write(header())
-            f.write("; Tempo\n")
-            BPM_min = 60e6/np.min(tempo['tempo'])
-            BPM_max = 60e6/np.max(tempo['tempo'])
-            if BPM_min == BPM_max:
-                f.write(f"; BPM = {BPM_max}\n")
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    if clear_cache:
+        ConversionCache(cache_dir).clear()
+    if not input and not batch:
+        return
+    cache = ConversionCache(cache_dir) if use_cache else None
+    if batch:
+        status = convert_batch(batch, output, jobs, profile, ppq=ppq, group_by=group_by, cache=cache, reader=reader)
+        profiler.report()
+        sys.exit(status)
+    if profile:
+        profiler.enable()
+    convert(input, output, ppq=ppq, group_by=group_by, midi_to_text=midi_to_text, cache=cache, reader=reader)
+    profiler.report()
+
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+MML_EXTENSIONS = (".mml", ".txt")
+
+
+# Converts a single file. The direction is taken from the extension of
+# the input file: MIDI files are converted to MML and MML files to MIDI.
+# With a cache (see conv_cache) unchanged inputs are not converted
+# again, and parsed MIDI tracks are reused when only ppq changes.
+def convert(input, output, ppq=48, group_by="instrument", midi_to_text=False, cache=None, reader="mido"):
+    if cache is not None and not midi_to_text:
+        # the input is hashed once for all of its keys
+        digest = cache.digest(input)
+        result_key = cache.digest_key(digest, stage="result", ppq=ppq, group_by=group_by)
+        if cache.load_file(result_key, output):
+            log.info("%s taken from the cache", output)
+            return
+    else:
+        cache = None
+    if input.endswith(MIDI_EXTENSIONS):
+        tracks = None
+        if cache is not None:
+            tracks_key = cache.digest_key(digest, stage="tracks", target_PPQ=48)
+            with profiler.stage("load_tracks"):
+                tracks = cache.load_tracks(tracks_key)
+        if tracks is None:
+            with profiler.stage("read_midi"):
+                tracks = read_midi(input, midi_to_text, reader=reader)
+            if cache is not None:
+                cache.store_tracks(tracks_key, *tracks)
+        (channels, names, tempo, PPQ) = tracks
+        tempo_map = TempoMap(tempo["ticks_abs"], tempo["tempo"], 48)
+        with profiler.stage("prepare_midi_channels"):
+            channels, names, leftovers = prepare_midi_channels(channels, names)
+        log.info("%d channel(s)", len(channels))
+        with profiler.stage("channel_length"):
+            channels = channel_length(channels, PPQ)
+        with profiler.stage("channel_to_mml"):
+            cmds = channel_to_mml(channels, names, ppq, tempo_map)
+            with open(output, "w", buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(header())
+                f.write("; Tempo\n")
+                BPM_min = 60e6/np.min(tempo['tempo'])
+                BPM_max = 60e6/np.max(tempo['tempo'])
+                if BPM_min == BPM_max:
+                    f.write(f"; BPM = {BPM_max}\n")
+                else:
+                    f.write(f"; BPM_min = {BPM_min}\n")
+                    f.write(f"; BPM_max = {BPM_max}\n")
+                f.write(f"t{amk_tempo(tempo_map.tempo[0])}\n")
+                f.write("\n")
+                f.write(";************************\n")
+                f.writelines(cmds)
+    elif input.endswith(MML_EXTENSIONS):
+        with profiler.stage("read_mml"):
+            channels = read_mml(input)
+        with profiler.stage("commands_to_table"):
+            cmd_table = commands_to_table(channels)
+        with profiler.stage("table_to_midi"):
+            table_to_midi(cmd_table, output, by=group_by)
+    else:
+        raise ValueError(f"unknown file type: {input}")
+    if cache is not None:
+        cache.store_file(result_key, output)
+
+
+# Converts all files of a directory, or all files matching a glob
+# pattern, in a pool of worker processes (one per core unless jobs is
+# given). MIDI files become MML files and the other way round, the
+# output is written next to the input or into output_dir (see
+# plan_batch for the files that are skipped). Nothing is converted if
+# two inputs would be written to the same output. With profile the
+# workers profile their conversions and the stages of all workers are
+# added up in the profiler of this process. Prints one status line per
+# file and returns the exit code: 1 if any file failed.
+def convert_batch(pattern, output_dir="", jobs=None, profile=False, **options):
+    if os.path.isdir(pattern):
+        files = sorted(
+            os.path.join(pattern, name) for name in os.listdir(pattern)
+            if name.endswith(MIDI_EXTENSIONS + (".mml",))
+        )
+    else:
+        files = sorted(glob.glob(pattern, recursive=True))
+    if len(files) == 0:
+        print(f"no files found for {pattern}")
+        return 1
+    jobs_list, skipped, clashes = plan_batch(files, output_dir)
+    if clashes:
+        for output, inputs in clashes.items():
+            print(f"[error]  {', '.join(inputs)} would all be written to {output}")
+        return 1
+    for input, output in skipped:
+        print(f"[skip]   {input}: its output {output} is an input of this batch")
+    files = [input for input, output in jobs_list]
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(convert_worker, input, output, options, profile) for input, output in jobs_list]
+        for future in as_completed(futures):
+            input, output, seconds, error, stages = future.result()
+            profiler.merge(stages)
+            if error is None:
+                print(f"[ok]     {input} -> {output} ({seconds:.2f} s)")
             else:
-                f.write(f"; BPM_min = {BPM_min}\n")
-                f.write(f"; BPM_max = {BPM_max}\n")
-            f.write(f"t{int(0.4096*60e6/np.max(tempo['tempo']))}\n")
-            f.write("\n")
-            f.write(";************************\n")
-            for line in cmds:
-                f.write(line)
-    elif input.endswith(".txt") or input.endswith(".mml"):
-        channels = read_mml(input)
-        cmd_table = commands_to_table(channels)
-        table_to_midi(cmd_table, output, by=group_by)
+                failed += 1
+                print(f"[failed] {input} ({seconds:.2f} s): {error}")
+    print(f"converted {len(files)-failed} of {len(files)} file(s) in {time.perf_counter()-start:.2f} s")
+    return 1 if failed else 0
+
+
+# Pairs every input with its output file. Inputs whose output is itself
+# an input of the batch (e.g. the a.mml a previous run made of a.mid) are
+# skipped, so no input is ever overwritten. Returns (jobs, skipped,
+# clashes): the (input, output) pairs to convert, the skipped pairs and
+# the outputs several inputs would be written to, with those inputs.
+def plan_batch(files, output_dir=""):
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+    inputs = {key(input) for input in files}
+    jobs, skipped, targets = list(), list(), dict()
+    for input in files:
+        output = batch_output(input, output_dir)
+        if key(output) in inputs:
+            skipped.append((input, output))
+            continue
+        jobs.append((input, output))
+        targets.setdefault(key(output), (output, list()))[1].append(input)
+    clashes = {output: sources for output, sources in targets.values() if len(sources) > 1}
+    return jobs, skipped, clashes
+
+
+# Name of the output file for a batch conversion.
+def batch_output(input, output_dir):
+    base, ext = os.path.splitext(input)
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    if ext in MIDI_EXTENSIONS:
+        return base + ".mml"
+    return base + ".mid"
+
+
+# Runs convert in a worker process. Only warnings of the conversion
+# are logged, the result is (input, output, seconds, error, stages) with
+# error being None on success and stages the profiled stages of this
+# conversion (empty without profile).
+def convert_worker(input, output, options, profile=False):
+    start = time.perf_counter()
+    logging.getLogger().setLevel(logging.WARNING)
+    if profile:
+        profiler.enable()
+    try:
+        convert(input, output, **options)
+    except Exception as err:
+        return input, output, time.perf_counter()-start, f"{type(err).__name__}: {err}", profiler.take()
+    return input, output, time.perf_counter()-start, None, profiler.take()
 
 
 # Everyone needs help from time to time. If arguments or options are
 # no longer present, this method prints the help in the console
 def usage():
     print("usage: python midi2mml.py -i <input> -o <output> [--readable-midi --group-by <instrument|channel>]")
+    print("       python midi2mml.py -i <input> -o <output> [--reader <mido|numpy>]")
+    print("       python midi2mml.py --batch <directory|pattern> [-o <directory> -j <jobs>]")
+    print("       python midi2mml.py [--no-cache --clear-cache --cache-dir <directory>]")
+    print("       python midi2mml.py [-v|--verbose -q|--quiet --profile]")
     print("")
     print("       <input>  is the MIDI, which acts as input file. The file specified here")
     print("                will be converted to mml format. If the file contains blanks, it")
@@ -82,12 +283,41 @@ def usage():
     print("                the channel number of the mml, because the midi has additional")
     print("                information and control channels, which do not exist in mml.")
     print("")
+    print("        reader  \"mido\" (default) or \"numpy\". numpy decodes the MIDI file into")
+    print("                arrays without creating an object per event, which loads large")
+    print("                files much faster. --readable-midi always uses mido.")
+    print("")
     print(" MML 2 MIDI only")
     print("")
     print("      group-by  May be \"instrument\" or \"channel\". In an MML there can be several")
     print("                instruments in one channel, in a midi one instrument per channel is")
     print("                defined. Most of the time it is useful to sort MIDIs by instrument.")
     print("                But from un on (e.g. drums) it is also helpful to sort by channel.")
+    print("")
+    print(" Batch mode")
+    print("")
+    print("         batch  a directory or a glob pattern (e.g. \"songs/**/*.mid\"). Every file")
+    print("                is converted in its own worker process, MIDI files to MML and MML")
+    print("                files to MIDI. With -o the output is written into the given")
+    print("                directory, otherwise next to the input file.")
+    print("")
+    print("          jobs  number of worker processes, defaults to the number of cores.")
+    print("")
+    print(" Cache")
+    print("")
+    print("     cache-dir  directory of the conversion cache, defaults to")
+    print("                ~/.cache/mml-ardupilot. Parsed MIDI tracks and conversion")
+    print("                results are stored there, keyed by the content of the input")
+    print("                file and the options, so unchanged files are not parsed again.")
+    print("      no-cache  neither read from nor write to the cache.")
+    print("   clear-cache  remove everything from the cache.")
+    print("")
+    print(" Diagnostics")
+    print("")
+    print("       verbose  -v, log the progress of every channel.")
+    print("         quiet  -q, only log warnings and errors.")
+    print("       profile  print wall time, calls and peak memory of every stage. With")
+    print("                --batch the stages of all workers are added up.")
     
 
 
@@ -136,6 +366,8 @@ def pitch_to_key(note, octave=5):
     if len(note)>1:
         if note[1]=="+":
             key += 1
+        elif note[1]=="-":
+            key -= 1
     key += 12*octave
     return key
 
@@ -147,63 +379,109 @@ def pitch_to_key(note, octave=5):
 # MIDI. PPQ ticks correspond exactly to a quarter note, 4*PPQ ticks
 # correspond to a whole note. The PPQ value can be multiples of 24, up
 # to a maximum of 960.
-def ticks_to_value(ticks, PPQ):
-    ticks_per_note = np.array([])
-    ticks_tri = np.array([])
-    for i in np.arange(int(4*PPQ), 0, -1):
-        if np.mod(4*PPQ, i) == 0:
-            if np.mod(i, 3) == 0:
-                ticks_tri = np.append(ticks_tri, [i])
-            else:
-                ticks_per_note = np.append(ticks_per_note, [i])
-    ticks_per_note = np.append(ticks_tri, ticks_per_note)
+# The tick count is decomposed greedily into note values, the result
+# is cached, so every tick count is only decomposed once per PPQ.
+def ticks_to_value(ticks, PPQ, dotted=False):
+    return _ticks_to_value(int(ticks), int(PPQ), dotted)
+
+
+@functools.lru_cache(maxsize=4096)
+def _ticks_to_value(ticks, PPQ, dotted):
     val = ""
-    for tpn in ticks_per_note:
-        factor = int(ticks/tpn)
+    for tpn, value in note_value_table(PPQ):
+        factor = ticks // tpn
         if factor > 0:
             if len(val) == 0:
-                val += f"{int(4*PPQ/tpn)}"
-                val += f"^{int(4*PPQ/tpn)}"*(factor-1)
-                print(f'val: {val}/factor {factor}/tpn {tpn}|{ticks}')
+                val += f"{value}"
+                val += f"^{value}"*(factor-1)
             else:
-                val += f"^{int(4*PPQ/tpn)}"*factor
-        ticks = np.mod(ticks, tpn)
-    # dotted notes for better readability
-    # for i in range(8):
-    #     expr = f"{2**i}"
-    #     for j in range(i, 8):
-    #         expr += f"^{2**(j+1)}"
-    #         subst = f"{2**i}" + "."*(j-i+1)
-    #         if val == expr:
-    #             return subst
+                val += f"^{value}"*factor
+        ticks = ticks % tpn
+    if dotted:
+        # dotted notes for better readability
+        return DOTTED_VALUES.get(val, val)
     return val
 
 
-# the reversed version of ticks_to_value.
+# Vectorized form of ticks_to_value for a whole column of tick
+# lengths. Every distinct tick count is converted once, the result is
+# broadcast back to the shape of the input as an object array.
+def ticks_to_values(ticks, PPQ, dotted=False):
+    ticks = np.asarray(ticks).astype(np.int64)
+    unique, inverse = np.unique(ticks, return_inverse=True)
+    values = np.array([ticks_to_value(t, PPQ, dotted) for t in unique.tolist()], dtype=object)
+    return values[inverse.reshape(ticks.shape)]
+
+
+# All note values (in ticks) that divide a whole note of the given PPQ,
+# as pairs (ticks, note value). Values that are divisible by three come
+# first, followed by the others, each group in descending order.
+@functools.lru_cache(maxsize=None)
+def note_value_table(PPQ):
+    whole = int(4*PPQ)
+    divisors = [i for i in range(whole, 0, -1) if whole % i == 0]
+    ticks_tri = [i for i in divisors if i % 3 == 0]
+    ticks_per_note = [i for i in divisors if i % 3 != 0]
+    return tuple((tpn, whole // tpn) for tpn in ticks_tri + ticks_per_note)
+
+
+# Tied note values which can be written as a dotted note, e.g. 4^8 is
+# the same as 4. and 4^8^16 the same as 4..
+def dotted_values():
+    values = dict()
+    for i in range(8):
+        expr = f"{2**i}"
+        for j in range(i, 8):
+            expr += f"^{2**(j+1)}"
+            values[expr] = f"{2**i}" + "."*(j-i+1)
+    return values
+
+
+DOTTED_VALUES = dotted_values()
+
+
+# the reversed version of ticks_to_value. Each part of a tied value
+# (e.g. 4^8) is either a note value with optional dots, a number of
+# ticks (=24) or only dots, which take the default length (l) of the
+# channel. Returns the ticks of the numbered parts and how many default
+# lengths the parts without a number add, e.g. (24.0, 1.5) for '.^8'.
+# The result is cached, because the same few values are converted over
+# and over again.
+@functools.lru_cache(maxsize=4096)
 def value_to_ticks(value, PPQ=48):
-    # get rid of dottet notes
-    while "." in value:
-        idx = value.find(".")
-        for i in range(idx):
-            try:
-                num = int(value[i:idx])
-                break
-            except ValueError:
-                error = True
-        value = value[0:idx] + "^" + str(2*num) + value[idx+1:len(value)]
-    # convert note value in ticks
-    ticks = 0
+    ticks = 0.0
+    defaults = 0.0
     for v in value.split("^"):
-        if len(v) == 0:
-            return 4*PPQ
-        if v[0] == "=":
-            ticks += int(v[1:len(v)])
+        if v[:1] == "=":
+            ticks += int(v[1:])
+            continue
+        number = v.rstrip(".")
+        # every dot adds half of the previous length
+        scale = 2 - 0.5**(len(v)-len(number))
+        if len(number) == 0:
+            defaults += scale
+        elif int(number) == 0:
+            ticks += 4*PPQ * scale
         else:
-            if int(v) == 0:
-                return 4*PPQ
-            else:
-                ticks += 4*PPQ/int(v)
-    return int(ticks)
+            ticks += 4*PPQ/int(number) * scale
+    return ticks, defaults
+
+
+# Channel messages that are kept by read_midi. The position in this
+# tuple is the type code stored while a track is being scanned, the
+# names are only materialized once per track.
+EVENT_TYPES = ("note_on", "note_off", "control_change", "program_change", "pitchwheel")
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+
+# Type codes (see EVENT_TYPES) of the channel messages by the upper
+# nibble of their status byte, -1 for the messages read_midi drops.
+SMF_EVENT_CODES = np.full(16, -1, dtype=np.int64)
+SMF_EVENT_CODES[0x8] = EVENT_CODES["note_off"]
+SMF_EVENT_CODES[0x9] = EVENT_CODES["note_on"]
+SMF_EVENT_CODES[0xB] = EVENT_CODES["control_change"]
+SMF_EVENT_CODES[0xC] = EVENT_CODES["program_change"]
+SMF_EVENT_CODES[0xE] = EVENT_CODES["pitchwheel"]
 
 
 # This Method is used to read the MIDI file. The individual channels
@@ -212,91 +490,178 @@ def value_to_ticks(value, PPQ=48):
 # relative, an absolute time is generated afterwards, which
 # facilitates later processing. The name of the channels is written to
 # the list names. Tempo and PPQ (Parts per Quarter) are also extracted
-# individually.
-def read_midi(filename, midi_to_text=False, target_PPQ=48):
+# individually, the tempo changes of all tracks are collected in one
+# DataFrame sorted by their absolute tick (in target_PPQ). With
+# reader="numpy" the file is decoded by smf_reader instead of mido,
+# which is much faster for large files and gives the same result.
+def read_midi(filename, midi_to_text=False, target_PPQ=48, reader="mido"):
+    if reader == "numpy" and not midi_to_text:
+        return read_midi_smf(filename, target_PPQ)
     midi = mido.MidiFile(filename)
     PPQ = midi.ticks_per_beat
-    print('PPQ', PPQ)
+    log.debug("PPQ %d", PPQ)
     channels = list()
     names = list()
-    tempo = pd.DataFrame()
+    tempo_values = list()
+    tempo_ticks = list()
 
-    track_id = 0
     for i, track in enumerate(midi.tracks):
-        if track_id >= 2:
-            break
-        track_id += 1
-
-        print(f"extract channel {i+1} of {len(midi.tracks)}")
-        content = []
-        df = pd.DataFrame()
-        channelname = "NA"
-        for msg in track:
-            content += [str(msg)]
-            if msg.type == "track_name":
-                channelname = msg.name
-            if msg.type == "note_on" or msg.type == "note_off":
-                type = msg.type
-                if msg.velocity == 0:
-                    type = "note_off"
-                tmp = pd.DataFrame({
-                    "type":[type],
-                    "channel":[msg.channel],
-                    "note":[msg.note],
-                    "velocity":[msg.velocity],
-                    "ticks_delta":[msg.time]
-                })
-                df = pd.concat([df, tmp])
-            if msg.type == "control_change":
-                tmp = pd.DataFrame({
-                    "type":[msg.type],
-                    "channel":[msg.channel],
-                    "control":[msg.control],
-                    "value":[msg.value],
-                    "ticks_delta":[msg.time]
-                })
-                df = pd.concat([df, tmp])
-            if msg.type == "program_change":
-                tmp = pd.DataFrame({
-                    "type":[msg.type],
-                    "channel":[msg.channel],
-                    "ticks_delta":[msg.time]
-                })
-                df = pd.concat([df, tmp])
-            if msg.type == "pitchwheel":
-                tmp = pd.DataFrame({
-                    "type":[msg.type],
-                    "channel":[msg.channel],
-                    "pitch":[msg.pitch],
-                    "ticks_delta":[msg.time]
-                })
-                df = pd.concat([df, tmp])
-            if msg.type == "set_tempo":
-                tmp = pd.DataFrame({
-                    "tempo":[msg.tempo],
-                    "time":[msg.time],
-                })
-                tempo = pd.concat([tempo, tmp])
+        log.debug("extract channel %d of %d", i+1, len(midi.tracks))
+        df, channelname, tempo = read_track(track)
+        tempo_values += tempo[0]
+        tempo_ticks += tempo[1]
         if midi_to_text:
             with open(f"track_{i}", "w") as f:
-                for line in content:
-                    f.write(line+"\n")
-        if "ticks_delta" not in df.columns:
-            continue
-        if "note_on" not in df["type"].values:
+                for msg in track:
+                    f.write(str(msg)+"\n")
+        if df is None:
             continue
-        df["ticks_abs"] = df["ticks_delta"].cumsum()
         df["ticks_abs"] = np.round(df["ticks_abs"]*target_PPQ/PPQ).astype(int)
-        df["ticks_abs"] = df["ticks_abs"].astype(int)
-        print(f"Note_min={df['note'].min()}")
-        print(f"Note_max={df['note'].max()}")
-        df["note"] = df["note"].fillna(0)
-        df["note"] = np.round(df["note"]).astype(int)
+        log_note_range(df)
         names += [channelname]
         channels += [df]
+    tempo = tempo_frame(tempo_values, tempo_ticks, PPQ, target_PPQ)
     return (channels, names, tempo, PPQ)
 
 
+# read_midi on top of smf_reader. The decoded event table is turned
+# into the same per track DataFrames as read_track builds, column by
+# column.
+def read_midi_smf(filename, target_PPQ=48):
+    smf = read_smf(filename)
+    PPQ = smf.PPQ
+    log.debug("PPQ %d", PPQ)
+    events = smf.events
+    kind = events["status"] & 0xF0
+    codes = SMF_EVENT_CODES[kind >> 4]
+    codes[(codes == EVENT_CODES["note_on"]) & (events["data2"] == 0)] = EVENT_CODES["note_off"]
+    keep = codes >= 0
+    events, codes = events[keep], codes[keep]
+    bounds = np.searchsorted(events["track"], np.arange(len(smf.names) + 1))
+    channels = list()
+    names = list()
+    for i in range(len(smf.names)):
+        log.debug("extract channel %d of %d", i+1, len(smf.names))
+        ev = events[bounds[i]:bounds[i+1]]
+        code = codes[bounds[i]:bounds[i+1]]
+        if not np.any(code == EVENT_CODES["note_on"]):
+            continue
+        is_note = (code == EVENT_CODES["note_on"]) | (code == EVENT_CODES["note_off"])
+        is_control = code == EVENT_CODES["control_change"]
+        is_pitch = code == EVENT_CODES["pitchwheel"]
+        data1 = ev["data1"].astype(np.int64)
+        data2 = ev["data2"].astype(np.int64)
+        ticks_abs = ev["tick"]
+        df = pd.DataFrame({
+            "type": np.array(EVENT_TYPES)[code],
+            "channel": (ev["status"] & 0x0F).astype(np.int16),
+            "note": np.where(is_note, data1, 0),
+            "velocity": np.where(is_note, data2, np.nan),
+            "control": np.where(is_control, data1, np.nan),
+            "value": np.where(is_control, data2, np.nan),
+            "pitch": np.where(is_pitch, (data2 << 7 | data1) - 8192, np.nan),
+            "ticks_delta": np.diff(ticks_abs, prepend=0),
+            "ticks_abs": np.round(ticks_abs*target_PPQ/PPQ).astype(int),
+        })
+        log_note_range(df)
+        names += [smf.names[i]]
+        channels += [df]
+    order = np.argsort(smf.tempo["tick"], kind="stable")
+    tempo = tempo_frame(smf.tempo["tempo"][order].tolist(), smf.tempo["tick"][order].tolist(), PPQ, target_PPQ)
+    return (channels, names, tempo, PPQ)
+
+
+
+# The tempo changes of all tracks as one DataFrame with the columns
+# tempo (microseconds per quarter) and ticks_abs (in target_PPQ), sorted
+# by time. Files without any set_tempo event get the MIDI default of
+# 120 BPM.
+def tempo_frame(tempo_values, tempo_ticks, PPQ, target_PPQ):
+    if len(tempo_values) == 0:
+        tempo_values, tempo_ticks = [500000], [0]
+    tempo = pd.DataFrame({
+        "tempo": tempo_values,
+        "ticks_abs": np.round(np.array(tempo_ticks)*target_PPQ/PPQ).astype(int),
+    })
+    return tempo.sort_values("ticks_abs", kind="stable", ignore_index=True)
+
+
+def log_note_range(df):
+    if log.isEnabledFor(logging.DEBUG):
+        notes = df.loc[df["type"].isin(["note_on", "note_off"]), "note"]
+        log.debug("Note_min=%d Note_max=%d", notes.min(), notes.max())
+
+
+# Walks a single mido track once. The channel messages are written to
+# preallocated arrays (one slot per message is the upper bound) and
+# turned into a DataFrame at the very end. Absolute ticks are counted
+# over all messages of the track, so the delta time of meta messages
+# is not lost. Returns (None, name, tempo) for tracks without notes.
+def read_track(track):
+    n = len(track)
+    types = np.empty(n, dtype=np.int8)
+    channel = np.empty(n, dtype=np.int16)
+    note = np.zeros(n, dtype=np.int16)
+    velocity = np.full(n, np.nan)
+    control = np.full(n, np.nan)
+    value = np.full(n, np.nan)
+    pitch = np.full(n, np.nan)
+    ticks_abs = np.empty(n, dtype=np.int64)
+    tempo_values = list()
+    tempo_ticks = list()
+    channelname = "NA"
+    note_on = EVENT_CODES["note_on"]
+    note_off = EVENT_CODES["note_off"]
+    has_note_on = False
+
+    tick = 0
+    k = 0
+    for msg in track:
+        tick += msg.time
+        msg_type = msg.type
+        code = EVENT_CODES.get(msg_type)
+        if code is None:
+            if msg_type == "track_name":
+                channelname = msg.name
+            elif msg_type == "set_tempo":
+                tempo_values.append(msg.tempo)
+                tempo_ticks.append(tick)
+            continue
+        types[k] = code
+        channel[k] = msg.channel
+        ticks_abs[k] = tick
+        if code == note_on or code == note_off:
+            if msg.velocity == 0:
+                code = note_off
+                types[k] = code
+            has_note_on = has_note_on or code == note_on
+            note[k] = msg.note
+            velocity[k] = msg.velocity
+        elif msg_type == "control_change":
+            control[k] = msg.control
+            value[k] = msg.value
+        elif msg_type == "pitchwheel":
+            pitch[k] = msg.pitch
+        k += 1
+
+    tempo = (tempo_values, tempo_ticks)
+    if not has_note_on:
+        return None, channelname, tempo
+    ticks_abs = ticks_abs[:k]
+    df = pd.DataFrame({
+        "type": np.array(EVENT_TYPES)[types[:k]],
+        "channel": channel[:k],
+        "note": note[:k].astype(int),
+        "velocity": velocity[:k],
+        "control": control[:k],
+        "value": value[:k],
+        "pitch": pitch[:k],
+        "ticks_delta": np.diff(ticks_abs, prepend=0),
+        "ticks_abs": ticks_abs,
+    })
+    return df, channelname, tempo
+
+
 # For the actual conversion of MIDI commands into MML notation only
 # the note_on and note_off commands are of interest. These commands
 # are extracted with this method and written to a new list. This list
@@ -307,66 +672,76 @@ def prepare_midi_channels(channels, names):
     new_channels = list()
     new_names = list()
     for i, channel in enumerate(channels):
-        print(f"prepare channel {i+1} of {len(channels)}")
+        log.debug("prepare channel %d of %d", i+1, len(channels))
         idx = np.logical_or(channel["type"]=="note_on", channel["type"]=="note_off")
         channel = channel[idx].reset_index(drop=True)
-        retlist = list()
-        retlist.append(extract_simultaneous_notes(channel, 0, retlist))
-        new_channels = new_channels + retlist
-        for x in range(len(retlist)):
+        voices = allocate_voices(channel)
+        new_channels = new_channels + voices
+        for x in range(len(voices)):
             new_names.append([names[i]])
     return new_channels, new_names, 0
 
 
-# If there are notes in a channel at the same time, only one of the
-# notes played simultaneously will be extracted. The other(s) remain
-# in the list. If the leftover list is not empty, another channel is
-# iteratively added to the channel list retlist until this initial
-# list is empty. If (for whatever reason) the list is never empty,
-# there is a termination criterion, which intervenes at more than 99
-# iteration depths and stops the extraction.
-def extract_simultaneous_notes(channel, iteration, retlist):
-    if iteration > 99:
-        print("more than 99 iterations were performed, most likely there is an error in the file")
-        return pd.DataFrame()
-    idx_on = channel["type"]=="note_on"
-    idx_off = channel["type"]=="note_off"
-    if len(idx_on)==0 or len(idx_off)==0:
-        return pd.DataFrame()
-    pnt_on = -1
-    pnt_off = -1
-    extract = pd.DataFrame()
-    leftover = channel.copy()
-    t_prev = 0
-    while True:
-        # find next note_on even
-        check = np.logical_and(idx_on, channel.index > pnt_on)
-        if not max(check):
-            break
-        pnt_on = np.argmax(check)
-        
-        # find the corresponding note_off event
-        note = channel.iloc[pnt_on].note
-        
-        check = np.logical_and(idx_off, np.logical_and(channel["note"]==note, channel.index > pnt_on))
-        if not max(check):
-            break
-        pnt_off = np.argmax(check)
-        
-        note_length = channel.iloc[pnt_off].ticks_abs - channel.iloc[pnt_on].ticks_abs
-
-        rest = channel.iloc[pnt_on].ticks_abs - t_prev
+# Pairs every note_on with the next note_off of the same key (first in,
+# first out) and returns the note intervals sorted by their start.
+# note_on events without a matching note_off are dropped.
+def note_intervals(channel):
+    is_on = (channel["type"] == "note_on").to_numpy()
+    keys = channel["note"].to_numpy()
+    ticks = channel["ticks_abs"].to_numpy()
+    open_notes = dict()
+    starts = list()
+    ends = list()
+    notes = list()
+    for on, key, tick in zip(is_on.tolist(), keys.tolist(), ticks.tolist()):
+        if on:
+            open_notes.setdefault(key, deque()).append(len(starts))
+            starts.append(tick)
+            ends.append(-1)
+            notes.append(key)
+        elif open_notes.get(key):
+            ends[open_notes[key].popleft()] = tick
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+    notes = np.array(notes, dtype=np.int64)
+    closed = ends >= 0
+    starts, ends, notes = starts[closed], ends[closed], notes[closed]
+    order = np.argsort(starts, kind="stable")
+    return starts[order], ends[order], notes[order]
+
+
+# If there are notes in a channel at the same time, they have to be
+# distributed over several monophonic voices. The notes are swept once
+# in order of their start time. Voices whose last note has ended are
+# kept in a min-heap, so every note goes to the lowest free voice and a
+# new voice is only opened if all existing ones are still sounding.
+# Each voice is a DataFrame with the columns note and ticks, in which
+# gaps are already filled with rests ("r").
+def allocate_voices(channel):
+    starts, ends, notes = note_intervals(channel)
+    busy = list()
+    free = list()
+    voice_end = list()
+    voices = list()
+    for start, end, note in zip(starts.tolist(), ends.tolist(), notes.tolist()):
+        while busy and busy[0][0] <= start:
+            heapq.heappush(free, heapq.heappop(busy)[1])
+        if free:
+            v = heapq.heappop(free)
+        else:
+            v = len(voices)
+            voices.append(([], []))
+            voice_end.append(0)
+        voice_notes, voice_ticks = voices[v]
+        rest = start - voice_end[v]
         if rest > 0:
-            extract = pd.concat([extract, pd.DataFrame({"note":["r"], "ticks":[rest]})])
-        extract = pd.concat([extract, pd.DataFrame({"note":[note], "ticks":[note_length]})])
-        leftover = leftover.drop([pnt_off])
-        leftover = leftover.drop([pnt_on])
-        pnt_on = pnt_off
-        t_prev = channel.iloc[pnt_off].ticks_abs
-    leftover = leftover.reset_index(drop=True)
-    if len(leftover) > 0:
-        retlist.append(extract_simultaneous_notes(leftover, iteration+1, retlist))
-    return extract
+            voice_notes.append("r")
+            voice_ticks.append(rest)
+        voice_notes.append(note)
+        voice_ticks.append(end - start)
+        voice_end[v] = end
+        heapq.heappush(busy, (end, v))
+    return [pd.DataFrame({"note": n, "ticks": t}) for n, t in voices]
 
 
 # Usually the individual tracks in a MIDI file do not have the same
@@ -398,53 +773,117 @@ def channel_length(channels, PPQ, round_to_next="beat"):
 # The actual conversion of MIDI to MML commands is done in this
 # method. The channels are processed one after the other. For each
 # channel, all notes from the MIDI are converted into an MML command
-# with corresponding pitch and length.
-def channel_to_mml(channels, names, PPQ):
-    cmds = list()
+# with corresponding pitch and length. The MML is not collected, but
+# yielded in chunks, so it can be written out while it is generated.
+# Tempo changes of the tempo map are written as t commands into channel
+# #0 (tempo is global in AMK); notes and rests of #0 which are running
+# during a change are split there.
+def channel_to_mml(channels, names, PPQ, tempo_map=None):
     for i, channel in enumerate(channels):
-        (octave_prev, note) = key_to_pitch(channel[channel["note"]!="r"].iloc[0].note)
-        note_min = channel[channel["note"]!="r"]["note"].min()
-        note_max = channel[channel["note"]!="r"]["note"].max()
-        (octave_min, note) = key_to_pitch(note_min)
-        (octave_max, note) = key_to_pitch(note_max)
-        cmd = "\n"
-        if i <= 7:
-            cmd += f"; {names[i]}\n"
-            cmd += f"#{i}\n"
-            cmd += f"o{octave_prev}   ; +{octave_max-octave_prev} / -{octave_prev-octave_min}\n"
-        else:
-            cmd += f"; ; {names[i]}\n"
-            cmd += f"; #{i}\n"
-            cmd += f"; o{octave_prev}   ; +{octave_max-octave_prev} / -{octave_prev-octave_min}\n"
-            cmd += "; "
-        for j, row in channel.iterrows():
-            (octave, note) = key_to_pitch(row.note)
-            value = ticks_to_value(row.ticks, PPQ)
-
-            if note != "r":
-                octave_diff = octave-octave_prev
-                if octave_diff > 0:
-                    cmd += ">"*octave_diff  # + " "
-                if octave_diff < 0:
-                    cmd += "<"*-octave_diff  # + " "
-                octave_prev = octave
-            # cmd += f"{note}{value}"
-            cmd += f"{note}{value.replace('^', note)}"
-        cmd += "\n"
-        cmds += [cmd]
-    return cmds
+        tempo = None
+        if i == 0 and tempo_map is not None and len(tempo_map) > 1:
+            channel, tempo = tempo_commands(channel, tempo_map)
+        yield from iter_channel_mml(channel, names[i], i, PPQ, tempo)
+
+
+# AMK tempo value of a MIDI tempo (microseconds per quarter).
+def amk_tempo(tempo):
+    return int(0.4096*60e6/tempo)
+
+
+# Splits the channel at every tempo change after the first one. Returns
+# the split channel and an object array with the t command to write in
+# front of every note or rest ("" for none). Changes after the end of
+# the channel and changes to the same AMK tempo are dropped.
+def tempo_commands(channel, tempo_map):
+    values = np.array([amk_tempo(t) for t in tempo_map.tempo.tolist()])
+    keep = np.append(False, values[1:] != values[:-1])
+    points = tempo_map.ticks[keep].astype(np.int64)
+    values = values[keep]
+    channel = split_channel(channel, points)
+    starts = np.cumsum(channel["ticks"].to_numpy(np.int64)) - channel["ticks"].to_numpy(np.int64)
+    inside = points < starts[-1] + channel["ticks"].iloc[-1]
+    tempo = np.full(len(channel), "", dtype=object)
+    tempo[np.searchsorted(starts, points[inside])] = [f"t{v} " for v in values[inside].tolist()]
+    return channel, tempo
+
+
+# Splits the notes and rests of a channel at the given ticks. The parts
+# of a split note are played as two notes, like the ties written by
+# iter_channel_mml.
+def split_channel(channel, points):
+    ticks = channel["ticks"].to_numpy(np.int64)
+    ends = np.cumsum(ticks)
+    starts = ends - ticks
+    points = points[(points > 0) & (points < ends[-1])]
+    owner = np.searchsorted(ends, points, side="right")
+    inside = points != starts[owner]
+    points, owner = points[inside], owner[inside]
+    if len(points) == 0:
+        return channel
+    bounds = np.append(np.sort(np.concatenate((starts, points))), ends[-1])
+    owner = np.repeat(np.arange(len(ticks)), 1 + np.bincount(owner, minlength=len(ticks)))
+    return pd.DataFrame({
+        "note": channel["note"].to_numpy(dtype=object)[owner],
+        "ticks": np.diff(bounds),
+    })
+
+
+# Number of notes which are joined into one chunk by iter_channel_mml.
+MML_CHUNK_NOTES = 512
+
+PITCH_NAMES = np.array(["c", "c+", "d", "d+", "e", "f", "f+", "g", "g+", "a", "a+", "b"], dtype=object)
+
+
+# Yields the MML of a single channel. The note column is split into
+# octave and pitch name arrays up front, octave changes are taken from
+# the difference of consecutive octaves. tempo holds optional commands
+# to write in front of the notes (see tempo_commands).
+def iter_channel_mml(channel, name, i, PPQ, tempo=None):
+    notes = channel["note"].to_numpy(dtype=object)
+    is_note = notes != "r"
+    keys = notes[is_note].astype(np.int64)
+    octave_prev = int(keys[0] // 12)
+    octave_min = int(keys.min() // 12)
+    octave_max = int(keys.max() // 12)
+    cmd = "\n"
+    if i <= 7:
+        cmd += f"; {name}\n"
+        cmd += f"#{i}\n"
+        cmd += f"o{octave_prev}   ; +{octave_max-octave_prev} / -{octave_prev-octave_min}\n"
+    else:
+        cmd += f"; ; {name}\n"
+        cmd += f"; #{i}\n"
+        cmd += f"; o{octave_prev}   ; +{octave_max-octave_prev} / -{octave_prev-octave_min}\n"
+        cmd += "; "
+    yield cmd
+
+    octaves = keys // 12
+    octave_moves = np.full(len(notes), "", dtype=object)
+    diff = np.diff(octaves, prepend=octave_prev)
+    octave_moves[is_note] = [">"*d if d > 0 else "<"*-d for d in diff.tolist()]
+    pitches = np.full(len(notes), "r", dtype=object)
+    pitches[is_note] = PITCH_NAMES[keys % 12]
+    values = ticks_to_values(channel["ticks"], PPQ)
+    if tempo is None:
+        tempo = np.full(len(notes), "", dtype=object)
+    for start in range(0, len(notes), MML_CHUNK_NOTES):
+        end = start + MML_CHUNK_NOTES
+        yield "".join(
+            f"{t}{move}{note}{value.replace('^', note)}"
+            for t, move, note, value in zip(tempo[start:end], octave_moves[start:end], pitches[start:end], values[start:end])
+        )
+    yield "\n"
 
 
 # This method reads an MML (text file) and extracts the individual
-# tracks #0 to #7.
+# tracks #0 to #7. Every channel is returned as a loop tree (see
+# parse_loops), iter_commands walks it as a flat command stream.
 def read_mml(infile):
     with open(infile, "r") as f:
         content = f.read()
     # remove comments
-    while ";" in content:
-        start = content.find(";")
-        end = content.find("\n", start)
-        content = content[0:start] + content[end+1:len(content)]
+    content = re.sub(r";[^\n]*", "", content)
     # remove linebreaks
     content = content.replace("\n", "")
     # remove blanks
@@ -454,173 +893,284 @@ def read_mml(infile):
     channels = []
     for i in range(1,9):
         start = content.find(f"#{i-1}")
+        if start < 0:
+            # the channel is not in the file
+            channels += [""]
+            continue
         end = content.find(f"#{i}")
         if end < 1:
             end = len(content)
         channels += [content[start:end]]
-    # expand (super) loops
+    # parse (super) loops, labeled loops are shared by all channels
     labeled_loop = dict()
     remote_code = dict()
     for i, channel in enumerate(channels):
-        channel = expand_labeled_loops(channel, labeled_loop, remote_code)
-        tmp = expand_loop(channel)
-        channels[i] = split_commands(tmp)
+        channels[i] = parse_loops(channel, labeled_loop, remote_code)
     return channels
 
 
-# This method finds labeled loops and remote code and expands
-# them. This makes the channel longer, but easier to understand for
-# the converter.
-def expand_labeled_loops(channel, labeled_loop, remote_code):
-    while "(" in channel:
-        start = channel.find("(")
-        end = channel.find(")", start)
-        loop_num = channel[start+1:end]
-        if channel[end+1] == "[":
-            end2 = channel.find("]", end)
-            # find loops in loops
-            while channel[end2+1] == "]":
-                end2 = channel.find("]", end2+2)
-            loop_content = channel[end+2:end2]
-            if "!" in loop_num:
-                remote_code[loop_num] = loop_content
-            else:
-                labeled_loop[loop_num] = loop_content
-            channel = channel[0:end+1]+channel[end2+1:len(channel)]
+# A loop of the loop tree. The body is a list of nodes, each node is
+# either a tuple of tokens or another Loop.
+Loop = namedtuple("Loop", ["body", "count"])
+
+LOOP_PATTERN = re.compile(r"""
+    (?P<super_open>\[\[)
+  | (?P<super_close>\]\])(?P<super_count>\d*)
+  | (?P<open>\[)
+  | (?P<close>\])(?P<count>\d*)
+  | \((?P<label>!?\d+)(?:,[^)]*)?\)(?:(?P<label_open>\[)|(?P<label_count>\d*))
+""", re.VERBOSE)
+
+
+# MML supports loops to save storage space. Instead of expanding them
+# in the text, the channel is parsed once into a tree of loops:
+#   [...]N     loop, played N times
+#   [[...]]N   super loop, may contain normal loops
+#   (N)[...]M  labeled loop N, defined and played M times
+#   (N)M       labeled loop N played again M times
+#   (!N)[...]  remote code, it is only defined and not played
+# Labeled loops are not copied, a call refers to the body of the
+# definition, so repetitive songs keep a tree of the size of the text.
+# The text between the loop commands is tokenized right away.
+def parse_loops(channel, labeled_loop, remote_code):
+    root = list()
+    # each open loop on the stack: (body, kind, label)
+    stack = [(root, "root", None)]
+    pos = 0
+    for m in LOOP_PATTERN.finditer(channel):
+        if m.start() > pos:
+            stack[-1][0].append(tuple(iter_tokens(channel[pos:m.start()], "amk")))
+        pos = m.end()
+        if m.group("super_open") is not None:
+            stack.append((list(), "super", None))
+        elif m.group("open") is not None:
+            stack.append((list(), "loop", None))
+        elif m.group("label") is not None:
+            label = m.group("label")
+            if m.group("label_open") is not None:
+                stack.append((list(), "label", label))
+                continue
+            if label.startswith("!"):
+                # call of remote code, nothing to play here
+                continue
+            if label not in labeled_loop:
+                raise ValueError(f"labeled loop ({label}) is used before it is defined")
+            stack[-1][0].append(Loop(labeled_loop[label], loop_count(m.group("label_count"))))
         else:
-            for i in range(1, 5):
-                try:
-                    num = int(channel[end+1:end+1+i])
-                except ValueError:
-                    error = True
-            if "!" in loop_num:
-                replace = remote_code[loop_num]
-            else:
-                replace = labeled_loop[loop_num]
-            channel = channel[0:start] + replace*num + channel[end+1:len(channel)]
-    return channel
-
-
-# MML supports loops to save storage space. As it is easier to convert
-# single notes, without any other modifications all loops are expanded
-# first.
-def expand_loop(channel):
-    while "[[" in channel:
-        start = channel.find("[[")
-        end = channel.find("]]", start)
-        loop = channel[start+2:end]
-        loop = loop.replace("[", "").replace("]", "")
-        for i in range(5,0,-1):
-            try:
-                count = int(channel[end+2:end+2+i])
-                break
-            except ValueError:
-                count = 1
-        channel = channel[0:start] + loop*count  + channel[end+2+i:-1]
-    while "[" in channel:
-        start = channel.find("[")
-        end = channel.find("]", start)
-        loop = channel[start+1:end]
-        for i in range(5,0,-1):
-            try:
-                count = int(channel[end+1:end+1+i])
-                break
-            except ValueError:
-                count = 1
-        channel = channel[0:start] + loop*count  + channel[end+1+i:-1]
-    return channel
-
-
-# The single mml commands do not need separators to be distinguished
-# from each other. This method splits the channel, which is a single
-# continuous string, into single commands for better processing.
-def split_commands(channel):
-    i = 0
-    while i < len(channel):
-        if channel[i] in ["c", "d", "e", "f", "g", "a", "b", "r", "h", "o", "<", ">", "@", "v", "w", "y", "t", "p", "n", "&"]:
-            channel = channel[0:i] + " " + channel[i:len(channel)]
-            i += 1
-        if channel[i] in ["$", "q"]:
-            channel = channel[0:i+3] + " " + channel[i+3:len(channel)]
-            channel = channel[0:i] + " " + channel[i:len(channel)]
-            i += 3
-        i += 1
-    return channel
+            closes_super = m.group("super_close") is not None
+            count = loop_count(m.group("super_count") if closes_super else m.group("count"))
+            if closes_super and stack[-1][1] != "super" and len(stack) > 2:
+                # "]]" closing a normal loop and its super loop at once
+                body, kind, label = stack.pop()
+                close_loop(stack, body, kind, label, 1, labeled_loop, remote_code)
+            if len(stack) == 1:
+                raise ValueError(f"unexpected '{m.group()}' at position {m.start()}")
+            body, kind, label = stack.pop()
+            close_loop(stack, body, kind, label, count, labeled_loop, remote_code)
+    if pos < len(channel):
+        stack[-1][0].append(tuple(iter_tokens(channel[pos:], "amk")))
+    if len(stack) > 1:
+        raise ValueError("loop is not closed")
+    return root
+
+
+def loop_count(digits):
+    if digits:
+        return int(digits)
+    return 1
+
+
+# Appends a finished loop to its parent. Labeled loops and remote code
+# are also stored under their label.
+def close_loop(stack, body, kind, label, count, labeled_loop, remote_code):
+    if kind == "label" and label.startswith("!"):
+        remote_code[label] = body
+        return
+    if kind == "label":
+        labeled_loop[label] = body
+    stack[-1][0].append(Loop(body, count))
+
+
+# Walks a loop tree and yields the tokens of the expanded channel one
+# after the other. The expanded channel is never built as a whole.
+def iter_commands(nodes):
+    for node in nodes:
+        if isinstance(node, Loop):
+            for _ in range(node.count):
+                yield from iter_commands(node.body)
+        else:
+            yield from node
+
+
+# Codes of the commands which are relevant for commands_to_table.
+NOTE, REST, OCTAVE, OCTAVE_UP, OCTAVE_DOWN, INSTRUMENT, LENGTH = range(1, 8)
+COMMAND_CODES = {
+    "note": NOTE,
+    "rest": REST,
+    "octave": OCTAVE,
+    "octave_up": OCTAVE_UP,
+    "octave_down": OCTAVE_DOWN,
+    "instrument": INSTRUMENT,
+    "length": LENGTH,
+}
+# AddmusicK plays notes without a length as eighths until the first l
+DEFAULT_NOTE_VALUE = 8
+COMMAND_DTYPE = np.dtype([("code", np.int8), ("arg", np.int64), ("ticks", np.float64),
+                          ("defaults", np.float64)])
+TABLE_DTYPE = np.dtype([
+    ("global_time", np.int64),
+    ("channel", np.int64),
+    ("instrument", np.int64),
+    ("key", np.int64),
+    ("ticks", np.int64),
+])
 
 
 # In order to be able to work better in the commands, they are brought
-# into a tabular form with this method.
+# into a tabular form with this method. The table is a structured
+# NumPy array with the fields global_time, channel, instrument, key
+# and ticks, one row per note.
 def commands_to_table(channels):
-    df = pd.DataFrame()
-    for i, channel in enumerate(channels):
-        global_time = 0
-        instrument = i
-        octave = 4
-        for cmd in channel.split():
-            # if it is a note
-            if cmd[0] in ["c", "d", "e", "f", "g", "a", "b"]:
-                if len(cmd)>1:
-                    if cmd[1] == "+":
-                        note = cmd[0:2]
-                        duration = cmd[2:len(cmd)]
-                    else:
-                        note = cmd[0]
-                        duration = cmd[1:len(cmd)]
-                else:
-                    note = cmd[0]
-                    duration = cmd[1:len(cmd)]
-                key = pitch_to_key(note, octave)
-                ticks = value_to_ticks(duration)
-                df = pd.concat([df, pd.DataFrame({"global_time":[global_time], "channel":[i], "instrument":[instrument], "key":[key], "ticks":[ticks]})])
-                global_time += ticks
-            # if it is a rest
-            if cmd[0] == "r":
-                duration = cmd[1:len(cmd)]
-                ticks = value_to_ticks(duration)
-                global_time += ticks
-            # if it is a octave definition, in- or decrease
-            if cmd[0] == "o":
-                octave = int(cmd[1:len(cmd)])
-            if cmd[0] == ">":
-                octave += 1
-            if cmd[0] == "<":
-                octave -= 1
-            # if the instrument ist changing
-            if cmd[0] == "@":
-                instrument = cmd[1:len(cmd)]
-    return df
-
-
-# Converts the table to a MIDI file
-def table_to_midi(table, output, by="instrument"):
-    mid = mido.MidiFile()
-    mid.ticks_per_beat=48
-    iter = np.unique(table[by])
-    print(f"found {len(iter)} unique group(s)")
-    for x in iter:
-        df_filter = table[table[by]==x]
-        df = pd.DataFrame()
-        for i in range(len(df_filter)):
-            key = df_filter.iloc[i].key
-            on = df_filter.iloc[i].global_time
-            off = on + df_filter.iloc[i].ticks
-            df = pd.concat([df, pd.DataFrame({"global_tick":[on], "event":["note_on"], "key":[key]})])
-            df = pd.concat([df, pd.DataFrame({"global_tick":[off], "event":["note_off"], "key":[key]})])
-        df.reset_index(inplace=True, drop=True)
-        df = df.sort_values(["global_tick", "event"], ascending=[True, True])
-        df["delta_ticks"] = np.ediff1d(df["global_tick"], to_begin=df["global_tick"].values[0])
-        track = mido.MidiTrack()
-        track.name = f"{by}_{x}"
-        for i in range(len(df)):
-            key = df.iloc[i].key
-            time = df.iloc[i].delta_ticks
-            event = df.iloc[i].event
-            try:
-                track.append(mido.Message(event, note=key, time=time))
-            except:
-                print("Could not append event")
-        mid.tracks.append(track)
-    mid.save(output)
+    tables = [channel_table(channel, i) for i, channel in enumerate(channels)]
+    if len(tables) == 0:
+        return np.empty(0, dtype=TABLE_DTYPE)
+    return np.concatenate(tables)
+
+
+# The commands of a channel are read into a compact array of (code,
+# argument, ticks, defaults) first. The state which MML carries from
+# command to command (octave, instrument, default length, time) is then
+# resolved for all rows at once with cumulative sums and forward filling.
+def channel_table(channel, i):
+    commands = np.fromiter(channel_commands(channel), dtype=COMMAND_DTYPE)
+    code = commands["code"]
+    arg = commands["arg"]
+    ticks = commands["ticks"]
+    idx = np.arange(len(commands))
+
+    # octave: last absolute octave plus the relative moves since then
+    moves = np.cumsum((code == OCTAVE_UP).astype(np.int64) - (code == OCTAVE_DOWN))
+    last_set = np.maximum.accumulate(np.where(code == OCTAVE, idx, -1))
+    has_set = last_set >= 0
+    octave = np.where(has_set, arg[last_set], 4) + moves - np.where(has_set, moves[last_set], 0)
+
+    # instrument: the channel number until the first instrument command
+    last_instrument = np.maximum.accumulate(np.where(code == INSTRUMENT, idx, -1))
+    instrument = np.where(last_instrument >= 0, arg[last_instrument], i)
+
+    # default length: the note value of the last l, in ticks
+    last_length = np.maximum.accumulate(np.where(code == LENGTH, idx, -1))
+    value = np.where(last_length >= 0, arg[last_length], DEFAULT_NOTE_VALUE)
+    ticks = (ticks + commands["defaults"] * (4*48 / value)).astype(np.int64)
+
+    # time: notes and rests advance the time
+    duration = np.where((code == NOTE) | (code == REST), ticks, 0)
+    global_time = np.cumsum(duration) - duration
+
+    is_note = code == NOTE
+    table = np.empty(np.count_nonzero(is_note), dtype=TABLE_DTYPE)
+    table["global_time"] = global_time[is_note]
+    table["channel"] = i
+    table["instrument"] = instrument[is_note]
+    table["key"] = arg[is_note] + 12*octave[is_note]
+    table["ticks"] = ticks[is_note]
+    return table
+
+
+# Yields (code, argument, ticks, defaults) for every relevant command of
+# a channel. For notes the argument is the key within the octave, for
+# notes and rests ticks and defaults are their length (see
+# value_to_ticks).
+def channel_commands(channel):
+    for token in iter_commands(channel):
+        code = COMMAND_CODES.get(token.kind)
+        if code is None:
+            continue
+        if code == NOTE:
+            yield (code, pitch_to_key(token.pitch + token.accidental, 0), *value_to_ticks(token.arg))
+        elif code == REST:
+            yield (code, 0, *value_to_ticks(token.arg))
+        elif code == OCTAVE or code == INSTRUMENT:
+            if token.length is not None:
+                yield (code, token.length, 0, 0)
+        elif code == LENGTH:
+            if token.length:
+                yield (code, token.length, 0, 0)
+        else:
+            yield (code, 0, 0, 0)
+
+
+# Converts the table to a MIDI file. For each group, all note_on and
+# note_off events are created at once, sorted with a single lexsort
+# (note_off before note_on on the same tick) and written as track
+# chunk bytes directly.
+def table_to_midi(table, output, by="instrument", PPQ=48):
+    groups = np.unique(table[by])
+    log.info("found %d unique group(s)", len(groups))
+    chunks = [midi_header(len(groups), PPQ)]
+    for x in groups:
+        chunks.append(track_chunk(table[table[by]==x], f"{by}_{x}"))
+    with open(output, "wb") as f:
+        f.writelines(chunks)
+
+
+# Velocity of all written events, the same as mido uses by default.
+NOTE_VELOCITY = 64
+
+
+# The header chunk of a type 1 (multi track) MIDI file.
+def midi_header(tracks, PPQ):
+    return b"MThd" + struct.pack(">IHHH", 6, 1, tracks, PPQ)
+
+
+# Builds the track chunk of one group of notes: a track name, all note
+# events and the end of track marker.
+def track_chunk(notes, name):
+    valid = (notes["key"] >= 0) & (notes["key"] <= 127)
+    if not valid.all():
+        log.warning("%s: skipped %d note(s) outside of the MIDI key range", name, np.count_nonzero(~valid))
+        notes = notes[valid]
+    n = len(notes)
+    ticks = np.concatenate([notes["global_time"], notes["global_time"] + notes["ticks"]])
+    status = np.concatenate([np.full(n, 0x90), np.full(n, 0x80)])
+    keys = np.concatenate([notes["key"], notes["key"]])
+    order = np.lexsort((status, ticks))
+    ticks = ticks[order]
+    deltas = np.diff(ticks, prepend=0)
+
+    delta_bytes, used = encode_varlen(deltas)
+    events = np.concatenate([
+        delta_bytes,
+        status[order, None].astype(np.uint8),
+        keys[order, None].astype(np.uint8),
+        np.full((2*n, 1), NOTE_VELOCITY, dtype=np.uint8),
+    ], axis=1)
+    used = np.concatenate([used, np.ones((2*n, 3), dtype=bool)], axis=1)
+
+    name = name.encode("latin-1")
+    data = b"\x00\xff\x03" + varlen(len(name)) + name
+    data += events[used].tobytes()
+    data += b"\x00\xff\x2f\x00"
+    return b"MTrk" + struct.pack(">I", len(data)) + data
+
+
+# Variable length quantities as used for MIDI delta times. Returns a
+# (n, 4) byte matrix, most significant group first, and a mask with
+# the bytes which are actually used for each value.
+def encode_varlen(values):
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) and (values.min() < 0 or values.max() >= 1 << 28):
+        raise ValueError("delta time out of the MIDI range")
+    groups = np.stack([(values >> shift) & 0x7f for shift in (21, 14, 7, 0)], axis=1).astype(np.uint8)
+    groups[:, :3] |= 0x80
+    length = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+    used = np.arange(4) >= (4 - length)[:, None]
+    return groups, used
+
+
+def varlen(value):
+    groups, used = encode_varlen([value])
+    return groups[used].tobytes()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,27 @@
-import mido
 import sys
+import logging
+import argparse
+from collections import deque
 
-# Map MIDI pitch classes (ignoring octave) to MML note letters.
 import mido
-import sys
+import numpy as np
+
+from smf_reader import read_smf
+
+log = logging.getLogger(__name__)
 
 # Map MIDI pitch classes (ignoring octave) to MML note letters.
 NOTE_MAP = {
     0: 'c', 1: 'c#', 2: 'd', 3: 'd#', 4: 'e',
     5: 'f', 6: 'f#', 7: 'g', 8: 'g#', 9: 'a', 10: 'a#', 11: 'b'
 }
+NOTE_NAMES = np.array([NOTE_MAP[i] for i in range(12)], dtype=object)
+
+# ArduPilot's MMLPlayer knows the octaves 0 to 6, its octave 0 starts at
+# MIDI note 36. Notes outside are moved into the nearest octave.
+OCTAVE_BASE = 36
+MIN_OCTAVE = 0
+MAX_OCTAVE = 6
 
 
 def note_to_mml(midi_note):
@@ -17,6 +29,11 @@ def note_to_mml(midi_note):
     return NOTE_MAP[midi_note % 12]
 
 
+def note_octave(midi_note):
+    """Return the ArduPilot octave of a MIDI note number (or an array of them)."""
+    return np.clip((np.asarray(midi_note) - OCTAVE_BASE) // 12, MIN_OCTAVE, MAX_OCTAVE)
+
+
 def duration_to_mml_length(duration_ticks, ticks_per_beat):
     """
     Convert a duration in ticks to an MML note length.
@@ -32,89 +49,188 @@ def duration_to_mml_length(duration_ticks, ticks_per_beat):
     return int(round(note_value))
 
 
-def midi_to_mml(midi_file, debug=True):
+def mml_lengths(durations, ticks_per_beat):
     """
-    Convert a MIDI file to an MML string using only the first track.
+    duration_to_mml_length for an array of durations, every distinct
+    duration is only converted once.
+    """
+    unique, inverse = np.unique(durations, return_inverse=True)
+    lengths = np.array([duration_to_mml_length(d, ticks_per_beat) for d in unique.tolist()], dtype=np.int64)
+    return lengths[inverse.reshape(-1)]
 
-    This function:
-      - Loads the MIDI file and selects only the first track.
-      - Processes note_on and note_off events to determine each note's start time and duration.
-      - Inserts rests (denoted by 'p') when there's a gap between notes.
-      - Flushes any lingering note_on events at the end.
+
+def note_messages(midi_file, tracks=None, reader="numpy"):
     """
-    mid = mido.MidiFile(midi_file)
-    ticks_per_beat = mid.ticks_per_beat
-    if debug:
-        print("Ticks per beat:", ticks_per_beat)
-
-    # Use only the first track (instead of merging all tracks).
-    track = mid.tracks[2]
-    # print(track, len(mid.tracks))
-    current_tick = 0
-    notes = []  # List to hold completed notes: { 'note': MIDI note, 'start': tick, 'end': tick }
-    pending_notes = {}  # Dictionary to hold currently active (pending) note_on events
-
-    # Process each MIDI message in the first track.
-    for msg in track:
-        current_tick += msg.time
-        if debug:
-            print(f"Tick: {current_tick}, Message: {msg}")
-        if msg.type == 'note_on' and msg.velocity > 0:
-            pending_notes.setdefault(msg.note, []).append(current_tick)
-        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-            if msg.note in pending_notes and pending_notes[msg.note]:
-                start_tick = pending_notes[msg.note].pop(0)
-                notes.append({
-                    'note': msg.note,
-                    'start': start_tick,
-                    'end': current_tick
-                })
+    Returns the ticks per beat of a MIDI file and its note messages as the
+    arrays (tick, note, velocity), with velocity 0 for note_off. tracks is a
+    track index or a list of them, None merges all tracks. reader is "numpy"
+    (smf_reader) or "mido".
+
+    The messages are ordered by time. At equal ticks note_off messages come
+    first, so a note struck again at the moment it is released is not cut
+    short.
+    """
+    if isinstance(tracks, int):
+        tracks = [tracks]
+    if reader == "numpy":
+        smf = read_smf(midi_file)
+        events = smf.events
+        kind = events["status"] & 0xF0
+        selected = (kind == 0x80) | (kind == 0x90)
+        if tracks is not None:
+            selected &= np.isin(events["track"], tracks)
+        events, kind = events[selected], kind[selected]
+        ticks_per_beat = smf.PPQ
+        tick = events["tick"]
+        note = events["data1"].astype(np.int64)
+        velocity = np.where(kind == 0x90, events["data2"], 0).astype(np.int64)
+    else:
+        mid = mido.MidiFile(midi_file)
+        ticks_per_beat = mid.ticks_per_beat
+        messages = []
+        for i, track in enumerate(mid.tracks):
+            if tracks is not None and i not in tracks:
+                continue
+            current_tick = 0
+            for msg in track:
+                current_tick += msg.time
+                if msg.type == 'note_on':
+                    messages.append((current_tick, msg.note, msg.velocity))
+                elif msg.type == 'note_off':
+                    messages.append((current_tick, msg.note, 0))
+        tick, note, velocity = np.array(messages, dtype=np.int64).reshape(-1, 3).T
+
+    order = np.lexsort((velocity > 0, tick))
+    return ticks_per_beat, tick[order], note[order], velocity[order]
+
+
+def pair_notes(ticks, notes, velocities):
+    """
+    Pairs every note_off with the oldest pending note_on of the same pitch.
+    Notes which are never released end with the last message. Returns the
+    arrays (start, end, note).
+    """
+    pending = {}  # pitch -> deque of start ticks
+    starts = []
+    ends = []
+    pitches = []
+    for tick, note, velocity in zip(ticks.tolist(), notes.tolist(), velocities.tolist()):
+        if velocity > 0:
+            queue = pending.get(note)
+            if queue is None:
+                queue = pending[note] = deque()
+            queue.append(tick)
+        else:
+            queue = pending.get(note)
+            if queue:
+                starts.append(queue.popleft())
+                ends.append(tick)
+                pitches.append(note)
 
     # Flush any pending notes that didn't receive a corresponding note_off.
-    for note, start_times in pending_notes.items():
-        for start_tick in start_times:
-            notes.append({
-                'note': note,
-                'start': start_tick,
-                'end': current_tick
-            })
-            if debug:
-                print(f"Flushed note {note} from tick {start_tick} to {current_tick}")
-
-    # Sort the notes in order of their start times.
-    notes.sort(key=lambda n: n['start'])
-
-    mml = ""
-    last_end = 0
-    for note_event in notes:
-        # Insert a rest ('p') if there's a gap between the previous note and this one.
-        if note_event['start'] > last_end:
-            gap = note_event['start'] - last_end
-            rest_length = duration_to_mml_length(gap, ticks_per_beat)
-            mml += f"p{rest_length}"
-        # Convert the MIDI note to an MML note letter.
-        note_letter = note_to_mml(note_event['note'])
-        duration = note_event['end'] - note_event['start']
-        print('duration_to_mml_length', duration, ticks_per_beat)
-        note_length = duration_to_mml_length(duration, ticks_per_beat)
-        mml += f"{note_letter}{note_length}"
-        last_end = note_event['end']
-
-    return mml
+    last_tick = ticks[-1] if len(ticks) else 0
+    for note, queue in pending.items():
+        for start_tick in queue:
+            log.debug("flushed note %d from tick %d to %d", note, start_tick, last_tick)
+            starts.append(start_tick)
+            ends.append(last_tick)
+            pitches.append(note)
+    return (np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64),
+            np.array(pitches, dtype=np.int64))
+
+
+def monophonic(start, end, note):
+    """
+    Reduces notes to the single voice the MMLPlayer can play. Of notes
+    starting at the same tick the highest one is kept, every note is cut off
+    where the next one starts. Returns the arrays (start, end, note) ordered
+    by time.
+    """
+    order = np.lexsort((-note, start))
+    start, end, note = start[order], end[order], note[order]
+    first = np.append(True, start[1:] != start[:-1])
+    start, end, note = start[first], end[first], note[first]
+    end = np.minimum(end, np.append(start[1:], end[-1:]))
+    played = end > start
+    return start[played], end[played], note[played]
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python midi_to_mml.py <input_midi_file>")
-        sys.exit(1)
-
-    midi_file = sys.argv[1]
-    # Set debug=True to see detailed processing information.
-    debug = True
-    mml_string = midi_to_mml(midi_file, debug)
+
+def notes_to_mml(start, end, note, ticks_per_beat):
+    """
+    Builds the MML of monophonic notes. Gaps between the notes become rests
+    ('p'), octave changes are written as '<' / '>' for a single octave and as
+    'o' otherwise. The first note always sets its octave.
+    """
+    if len(note) == 0:
+        return ""
+    octave = note_octave(note)
+    step = np.diff(octave, prepend=octave[0])
+    moves = np.full(len(note), "", dtype=object)
+    moves[step == 1] = ">"
+    moves[step == -1] = "<"
+    jumps = np.flatnonzero(np.abs(step) > 1)
+    moves[jumps] = [f"o{o}" for o in octave[jumps].tolist()]
+    moves[0] = f"o{octave[0]}"
+
+    gap = start - np.append(0, end[:-1])
+    rests = np.full(len(note), "", dtype=object)
+    has_rest = gap > 0
+    rests[has_rest] = [f"p{length}" for length in mml_lengths(gap[has_rest], ticks_per_beat).tolist()]
+
+    lengths = mml_lengths(end - start, ticks_per_beat)
+    return "".join(
+        f"{rest}{move}{name}{length}"
+        for rest, move, name, length in zip(rests, moves, NOTE_NAMES[note % 12], lengths.tolist())
+    )
+
+
+def midi_to_mml(midi_file, debug=True, reader="numpy", tracks=None):
+    """
+    Convert a MIDI file to an MML string for ArduPilot's MMLPlayer.
+
+    This function:
+      - Reads the note messages of the selected tracks (all tracks merged if
+        tracks is None).
+      - Pairs note_on and note_off events to determine each note's start time and duration.
+      - Reduces polyphonic passages to a single voice, keeping the highest note.
+      - Inserts rests (denoted by 'p') when there's a gap between notes and
+        octave changes where the notes leave the current octave.
+    """
+    # the per note output only pays off if somebody listens
+    debug = debug and log.isEnabledFor(logging.DEBUG)
+    ticks_per_beat, ticks, notes, velocities = note_messages(midi_file, tracks, reader)
+    log.debug("ticks per beat: %d, %d note messages", ticks_per_beat, len(ticks))
+
+    start, end, note = pair_notes(ticks, notes, velocities)
+    if len(note) == 0:
+        return ""
+    start, end, note = monophonic(start, end, note)
+    log.debug("%d notes after the reduction to one voice", len(note))
+    if debug:
+        for s, e, n in zip(start.tolist(), end.tolist(), note.tolist()):
+            log.debug("note %d from tick %d to %d", n, s, e)
+    return notes_to_mml(start, end, note, ticks_per_beat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a MIDI file to ArduPilot MML.")
+    parser.add_argument("midi_file")
+    parser.add_argument("-t", "--track", type=int, action="append",
+                        help="track to convert, may be repeated (default: all tracks merged)")
+    parser.add_argument("--reader", choices=["numpy", "mido"], default="numpy")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every note")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(levelname)s %(message)s")
+    mml_string = midi_to_mml(args.midi_file, args.verbose, args.reader, args.track)
     print("Generated MML String:")
     print(mml_string)
 
 
+if __name__ == '__main__':
+    main(sys.argv[1:])
+
+
 """ boomer
 e8g1p8g8e1p8a8g8a8g8a8g8a8g8a8b1p8e8g1p8g8e1p8a8g8a8g8a8g8a8g8a8b1p8e8g1p8g8e1p8a8g8a8g8a8g8a8g8a8b1p8e8g1p8g8e1p8a8g8a8g8a8g8a8g8a8b1p8e8g1p8g8e1p8a8g8a8g8a8g8a8g8a8b1p8e8g1p8g8e1p8a8g8a8g8a8g8a8g8a8b1
 p0e8g8b8p8e8g8b8e8g8b8p8e8g8b8b8g8e8p8e8g8c8p8c8g8e8e8g8c8p8e8g8c8e8g8c8p8e8c8a8p8e8c8a8a8e8c8p8e8c8a8a8e8c8p8e8g8c8p8e8g8c8e8g8c8p8e8g8c8e8g8c8p8e8g8b8p8e8g8b8e8g8b8p8e8g8b8b8g8e8p8e8g8c8p8c8g8e8e8g8c8p8e8g8c8e8g8c8p8e8c8a8p8e8c8a8a8e8c8p8e8c8a8a8e8c8p8e8g8c8p8e8g8c8e8g8c8p8e8g8c8e8g8c8p8e8g8b8p8e8g8b8e8g8b8p8e8g8b8b8g8e8p8e8g8c8p8c8g8e8e8g8c8p8e8g8c8e8g8c8p8e8c8a8p8e8c8a8a8e8c8p8e8c8a8a8e8c8p8e8g8c8p8e8g8c8e8g8c8p8e8g8c8e8g8c8p8e8g8b8p8e8g8b8e8g8b8p8e8g8b8b8g8e8p8e8g8c8p8c8g8e8e8g8c8p8e8g8c8e8g8c8p8e8c8a8p8e8c8a8a8e8c8p8e8c8a8a8e8c8p8e8g8c8p8e8g8c8e8g8c8p8e8g8c8e8g8c8p8e8g8b8p8e8g8b8e8g8b8p8e8g8b8b8g8e8p8e8g8c8p8c8g8e8e8g8c8p8e8g8c8e8g8c8p8e8c8a8p8e8c8a8a8e8c8p8e8c8a8a8e8c8p8e8g8c8p8e8g8c8e8g8c8p8e8g8c8e8g8c8p0e8g8b8p8e8g8b8e8g8b8p8e8g8b8b8g8e8p8e8g8c8p8c8g8e8e8g8c8p8e8g8c8e8g8c8p8e8c8a8p8e8c8a8a8e8c8p8e8c8a8a8e8c8p8e8g8c8p8e8g8c8e8g8c8p8e8g8c8e8g8c8p8e8g8b8p8e8g8b8e8g8b8p8e8g8b8b8g8e8p8e8g8c8p8c8g8e8e8g8c8p8e8g8c8e8g8c8p8e8c8a8p8e8c8a8a8e8c8p8e8c8a8a8e8c8p8e8g8c8p8e8g8c8e8g8c8p8e8g8c8e8g8c8
@@ -0,0 +1,130 @@
+"""
+Playback duration of MML segments, as ArduPilot's MMLPlayer plays them.
+
+Every PLAY_TUNE starts the player over from its defaults (tempo 120, default
+length 4, octave 4, normal articulation), so each segment is timed on its
+own. The player follows these rules:
+
+  - a note of length n has a period of 240 / tempo / n seconds; a missing
+    or zero length takes the default length ('L'), 'N' notes always do
+  - a rest of length n lasts 240 / tempo / n seconds too, but a missing or
+    zero length is a whole rest, rests do not take the default length
+  - articulation splits the period of a note into sound and silence, 7/8
+    for 'MN', all of it for 'ML' and 3/4 for 'MS'
+  - dots extend the sound after the articulation shortened it, by half of
+    it, a quarter and so on; the silence stays as it is
+  - sound and silence are timed in whole microseconds
+  - 'T' below 32 and 'L0' stop the tune
+  - ties ('^') extend the note or rest before them by their length
+
+Octave, volume and 'MF'/'MB' commands take no time.
+
+segment_duration() caches its results by segment content, so the segments
+the players and the show compiler restate over and over are parsed once.
+segment_times() times all segments of a melody in one pass.
+
+    python mml_duration.py "t140 l8 c d e. p4"
+"""
+import sys
+import functools
+
+import numpy as np
+
+from mml_lexer import iter_tokens
+from tempo_map import TempoMap
+
+DEFAULT_TEMPO = 120
+DEFAULT_LENGTH = 4
+MIN_TEMPO = 32
+# resolution of the note layout, ticks per quarter note
+TIMELINE_PPQ = 48
+# part of the period of a note that sounds, by articulation
+ARTICULATION = {"mn": 0.875, "ml": 1.0, "ms": 0.75}
+CACHE_SIZE = 16384
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def segment_duration(segment):
+    """
+    Returns the time in seconds the MMLPlayer takes to play one segment
+    (a str or bytes).
+
+    Notes and rests are laid out in ticks first, the TempoMap of the tempo
+    changes of the segment then gives the length of a tick at every note.
+    """
+    if isinstance(segment, bytes):
+        segment = segment.decode("utf-8")
+    whole = 4 * TIMELINE_PPQ
+    length = DEFAULT_LENGTH
+    articulation = ARTICULATION["mn"]
+    tick = 0.0
+    change_ticks = [0.0]
+    change_bpm = [DEFAULT_TEMPO]
+    starts, sounds, silences = list(), list(), list()
+    for token in iter_tokens(segment):
+        kind = token.kind
+        if kind == "tie":
+            # extends the sound of the note or rest before it
+            if token.length and sounds:
+                ticks = whole / token.length * (2 - 0.5 ** token.dots)
+                sounds[-1] += ticks
+                tick += ticks
+        elif kind in ("note", "rest", "note_number"):
+            if kind == "rest":
+                sound, silence = whole / (token.length or 1), 0.0
+            else:
+                period = whole / (length if kind == "note_number" else token.length or length)
+                sound, silence = period * articulation, period * (1 - articulation)
+            sound *= 2 - 0.5 ** token.dots
+            starts.append(tick)
+            sounds.append(sound)
+            silences.append(silence)
+            tick += sound + silence
+        elif kind == "tempo" and token.length is not None:
+            if token.length < MIN_TEMPO:
+                break
+            change_ticks.append(tick)
+            change_bpm.append(token.length)
+        elif kind == "length" and token.length is not None:
+            if token.length == 0:
+                break
+            length = token.length
+        elif kind == "mode":
+            articulation = ARTICULATION.get(token.text.lower(), articulation)
+    if not starts:
+        return 0.0
+    tempo_map = TempoMap.from_bpm(change_ticks, change_bpm, TIMELINE_PPQ)
+    # microseconds per tick at every note, sound and silence are whole
+    # microseconds each
+    rate = tempo_map.tempo_at(starts) / TIMELINE_PPQ
+    microseconds = np.floor(np.asarray(sounds) * rate) + np.floor(np.asarray(silences) * rate)
+    return float(microseconds.sum()) / 1e6
+
+
+def segment_durations(segments):
+    """
+    Returns the durations of all segments as a float64 array.
+    """
+    return np.fromiter((segment_duration(segment) for segment in segments), dtype=np.float64,
+                       count=len(segments))
+
+
+def segment_times(segments):
+    """
+    Returns the start time of every segment plus the end time of the melody
+    (one entry more than there are segments), in seconds after the start of
+    the first segment.
+    """
+    times = np.zeros(len(segments) + 1)
+    np.cumsum(segment_durations(segments), out=times[1:])
+    return times
+
+
+def main(argv):
+    for segment in argv:
+        print(f"{segment_duration(segment):.6f} s  {segment}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,113 @@
+"""
+Shared MML tokenizer.
+
+An MML string is turned into a list of Token tuples in a single pass of one
+compiled regular expression. Two dialects are understood:
+
+  - "ardupilot": the MML played by ArduPilot's MMLPlayer (PLAY_TUNE). It is
+    case-insensitive, rests are written as 'p' (or 'r') and lengths may be
+    dotted.
+  - "amk": the AddmusicK dialect read and written by conv_mid. Notes may carry
+    ties (^) and tick lengths (=N), and there are hex commands ($xx, qxx) and
+    instruments (@N). Everything up to the next command letter belongs to the
+    command, like split_commands always did.
+
+Every token carries:
+  kind        what the token is, e.g. 'note', 'rest', 'tempo', 'octave'
+  text        the source text of the token
+  offset      index of the token in the source string
+  pitch       note letter (lower case) for notes, otherwise ''
+  accidental  '+', '#' or '-' for notes, otherwise ''
+  length      number after the command, e.g. the note value of a note (8 for
+              an eighth) or the tempo of a 't'; None if not given
+  dots        number of dots after the length
+  arg         everything after the command letter(s), e.g. '4^8' or '120'
+"""
+import re
+from collections import namedtuple
+
+Token = namedtuple("Token", ["kind", "text", "offset", "pitch", "accidental", "length", "dots", "arg"])
+
+ARDUPILOT_PATTERN = re.compile(r"""
+    (?P<pitch>[a-g]) (?P<acc>[#+-]?) (?P<arg>(?P<num>\d*) (?P<dots>\.*))
+  | (?P<head>m[nlsfb]|[prn^tlov<>]) (?P<harg>(?P<hnum>\d*) (?P<hdots>\.*))
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.IGNORECASE | re.VERBOSE | re.DOTALL)
+
+ARDUPILOT_KINDS = {
+    "p": "rest",
+    "r": "rest",
+    "n": "note_number",
+    "^": "tie",
+    "t": "tempo",
+    "l": "length",
+    "o": "octave",
+    "v": "volume",
+    "<": "octave_down",
+    ">": "octave_up",
+    "m": "mode",
+}
+
+AMK_PATTERN = re.compile(r"""
+    (?P<pitch>[a-g]) (?P<acc>[+-]?)
+        (?P<arg>(?P<num>=?\d*) (?P<dots>\.*) [^a-grholtvwypn&<>@$q\s]*)
+  | (?P<head>\$[0-9a-fA-F]{2}|q[0-9a-fA-F]{2}|[rholtvwypn&<>@])
+        (?P<harg>(?P<hnum>=?\d*) (?P<hdots>\.*) [^a-grholtvwypn&<>@$q\s]*)
+  | (?P<space>\s+)
+  | (?P<other>[^a-grholtvwypn&<>@$q\s]+|.)
+""", re.VERBOSE | re.DOTALL)
+
+AMK_KINDS = {
+    "r": "rest",
+    "h": "transpose",
+    "o": "octave",
+    "l": "length",
+    "t": "tempo",
+    "v": "volume",
+    "w": "global_volume",
+    "y": "pan",
+    "p": "vibrato",
+    "n": "noise",
+    "&": "slur",
+    "<": "octave_down",
+    ">": "octave_up",
+    "@": "instrument",
+    "$": "hex",
+    "q": "quantize",
+}
+
+DIALECTS = {
+    "ardupilot": (ARDUPILOT_PATTERN, ARDUPILOT_KINDS),
+    "amk": (AMK_PATTERN, AMK_KINDS),
+}
+
+
+def tokenize(mml, dialect="ardupilot"):
+    """
+    Splits an MML string into a list of Token tuples. Whitespace is skipped.
+    """
+    return list(iter_tokens(mml, dialect))
+
+
+def iter_tokens(mml, dialect="ardupilot"):
+    """
+    Lazy form of tokenize(), yields one Token after the other.
+    """
+    pattern, kinds = DIALECTS[dialect]
+    for m in pattern.finditer(mml):
+        pitch, acc, arg, num, dots, head, harg, hnum, hdots, space, other = m.groups()
+        if pitch is not None:
+            yield Token("note", m.group(), m.start(), pitch.lower(), acc,
+                        _length(num), len(dots), arg)
+        elif head is not None:
+            yield Token(kinds[head[0].lower()], m.group(), m.start(), "", "",
+                        _length(hnum), len(hdots), harg)
+        elif other is not None:
+            yield Token("other", other, m.start(), "", "", None, 0, "")
+
+
+def _length(num):
+    if num and num[0] != "=":
+        return int(num)
+    return None
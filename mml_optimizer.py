@@ -0,0 +1,292 @@
+"""
+Byte minimizing rewriter for ArduPilot MML.
+
+optimize() turns a melody into a shorter one that plays the same notes for the
+same time:
+
+  - notes are respelled from their absolute pitch, octave changes become '<'
+    or '>' for one octave and 'oN' otherwise; 'c-' and 'b+' save them for
+    the semitone next to the current octave
+  - the default length (L) is chosen by dynamic programming, so note lengths
+    are only written where that is shorter than changing L; rests do not
+    take L (a 'p' without a length is a whole rest), they keep their length
+  - consecutive rests are merged and rewritten with dots where they fit
+    exactly, if that is shorter than writing them one by one; ties ('^')
+    are merged into their note if the result is a single undotted length
+  - tempo, volume and mode commands that do not change anything are dropped
+
+Dots on notes are kept as they are written. The MMLPlayer shortens a note by
+its articulation before it extends it by the dots, so a dotted note is not
+the same as the tied lengths it stands for; only rests are rewritten with
+dots.
+
+    python mml_optimizer.py "t120 l8 c8 d8 e8 p8 p8 p4"
+"""
+import sys
+from fractions import Fraction
+from collections import namedtuple
+
+from mml_lexer import iter_tokens
+
+DEFAULT_TEMPO = 120
+DEFAULT_OCTAVE = 4
+DEFAULT_LENGTH = 4
+MIN_OCTAVE = 0
+MAX_OCTAVE = 6
+MAX_DOTS = 3
+# longest rest the optimizer writes as a sequence of tokens
+MAX_REST_TOKENS = 64
+
+PITCH_INDEX = {"c": 0, "d": 2, "e": 4, "f": 5, "g": 7, "a": 9, "b": 11}
+ACCIDENTALS = {"": 0, "+": 1, "#": 1, "-": -1}
+# spelling of the semitones -1 to 12 relative to the c of the current octave
+NOTE_NAMES = {i: name for i, name in enumerate(
+    ["c", "c+", "d", "d+", "e", "f", "f+", "g", "g+", "a", "a+", "b", "b+"])}
+NOTE_NAMES[-1] = "c-"
+
+# kind is one of
+#   note    pitch is the absolute semitone (octave * 12 + index)
+#   number  an 'N' command, pitch is its argument; it takes the default length
+#   rest    pitch is None
+#   tie     a '^' that could not be merged, printed as it is
+#   state   tempo, volume or mode; pitch is the state key, text the value
+#   raw     anything else, printed as it is
+# For notes and rests pieces is the list of (value, dots) they last for.
+Event = namedtuple("Event", ["kind", "pitch", "pieces", "text"])
+
+
+def piece_duration(value, dots):
+    """
+    Duration of a length with dots, in whole notes.
+    """
+    return Fraction(2 ** (dots + 1) - 1, value * 2 ** dots)
+
+
+def single_piece(duration, max_dots=MAX_DOTS):
+    """
+    Returns the shortest (value, dots) lasting exactly duration, or None.
+    """
+    best = None
+    for dots in range(max_dots + 1):
+        value = Fraction(2 ** (dots + 1) - 1, 2 ** dots) / duration
+        if value.denominator == 1 and value >= 1:
+            cost = len(str(value.numerator)) + dots
+            if best is None or cost < best[0]:
+                best = (cost, (value.numerator, dots))
+    return best[1] if best else None
+
+
+def split_duration(duration):
+    """
+    Splits a duration into as few (value, dots) as the greedy way finds, or
+    returns None if it cannot be written exactly.
+    """
+    pieces = list()
+    while duration > 0 and len(pieces) < MAX_REST_TOKENS:
+        piece = single_piece(duration)
+        if piece is not None:
+            pieces.append(piece)
+            return pieces
+        value = 1
+        while Fraction(1, value) > duration:
+            value *= 2
+        dots = 0
+        while dots < MAX_DOTS and piece_duration(value, dots + 1) <= duration:
+            dots += 1
+        pieces.append((value, dots))
+        duration -= piece_duration(value, dots)
+    return pieces if duration == 0 else None
+
+
+def rest_text(value, dots):
+    """
+    Returns a rest of one length as the MMLPlayer reads it, 'p' alone is a
+    whole rest.
+    """
+    return ("p" if value == 1 else f"p{value}") + "." * dots
+
+
+def parse(melody):
+    """
+    Turns a melody into a list of Events with absolute pitches and explicit
+    lengths, resolving octave and default length commands.
+    """
+    events = list()
+    octave = DEFAULT_OCTAVE
+    length = DEFAULT_LENGTH
+    for token in iter_tokens(melody):
+        kind = token.kind
+        if kind == "note":
+            pitch = octave * 12 + PITCH_INDEX[token.pitch] + ACCIDENTALS[token.accidental]
+            events.append(Event("note", pitch, [(token.length or length, token.dots)], ""))
+        elif kind == "rest":
+            # the MMLPlayer plays a rest without a length as a whole rest
+            events.append(Event("rest", None, [(token.length or 1, token.dots)], ""))
+        elif kind == "note_number":
+            events.append(Event("number", token.length or 0, [(length, token.dots)], ""))
+        elif kind == "tie" and events and events[-1].kind in ("note", "rest") and token.length:
+            events[-1].pieces.append((token.length, token.dots))
+        elif kind == "octave":
+            if token.length is not None:
+                octave = min(max(token.length, MIN_OCTAVE), MAX_OCTAVE)
+        elif kind == "octave_up":
+            octave = min(octave + 1, MAX_OCTAVE)
+        elif kind == "octave_down":
+            octave = max(octave - 1, MIN_OCTAVE)
+        elif kind == "length":
+            if token.length:
+                length = token.length
+        elif kind == "tempo" and token.length:
+            events.append(Event("state", "t", None, str(token.length)))
+        elif kind == "volume" and token.length is not None:
+            events.append(Event("state", "v", None, str(token.length)))
+        elif kind == "mode":
+            letter = token.text[1].lower()
+            # foreground/background and the articulation are separate states
+            events.append(Event("state", "mb" if letter in "fb" else "mn", None, "m" + letter))
+        else:
+            events.append(Event("raw", None, None, token.text))
+    return events
+
+
+def merge(events):
+    """
+    Merges consecutive rests and the ties of notes and rests where the result
+    can be written exactly.
+    """
+    merged = list()
+    for event in events:
+        if event.kind == "rest" and merged and merged[-1].kind == "rest":
+            merged[-1].pieces.extend(event.pieces)
+        else:
+            merged.append(Event(event.kind, event.pitch, list(event.pieces or ()), event.text))
+    result = list()
+    for event in merged:
+        if event.kind == "rest" and len(event.pieces) > 1:
+            pieces = split_duration(sum(piece_duration(*p) for p in event.pieces))
+            # fewer tokens are not always fewer characters ('pp' is 'p...p8')
+            if pieces is not None and (len("".join(rest_text(*p) for p in pieces))
+                                       < len("".join(rest_text(*p) for p in event.pieces))):
+                event = event._replace(pieces=pieces)
+            result.extend(Event("rest", None, [piece], "") for piece in event.pieces)
+        elif event.kind == "note" and len(event.pieces) > 1:
+            # a dotted note is shorter than the tie it would replace
+            piece = single_piece(sum(piece_duration(*p) for p in event.pieces), max_dots=0)
+            if piece is not None:
+                result.append(event._replace(pieces=[piece]))
+            else:
+                result.append(event._replace(pieces=event.pieces[:1]))
+                result.extend(Event("tie", None, [p], "") for p in event.pieces[1:])
+        else:
+            result.append(event)
+    return result
+
+
+def choose_lengths(values, fixed):
+    """
+    Chooses the default length in effect for every length token, minimizing
+    the characters written. values are the token values, fixed marks tokens
+    which cannot carry a number ('N' commands). Returns the list of default
+    lengths.
+    """
+    candidates = sorted(set(values) | {DEFAULT_LENGTH})
+    infinite = float("inf")
+    # cost[L]: fewest characters so far with default length L
+    cost = {L: (0 if L == DEFAULT_LENGTH else len(f"l{L}")) for L in candidates}
+    back = list()
+    for value, is_fixed in zip(values, fixed):
+        best_prev = min(cost, key=cost.get)
+        new_cost = dict()
+        choice = dict()
+        for L in candidates:
+            token = 0 if value == L else (infinite if is_fixed else len(str(value)))
+            stay = cost[L]
+            switch = cost[best_prev] + len(f"l{L}")
+            if stay <= switch:
+                new_cost[L], choice[L] = stay + token, L
+            else:
+                new_cost[L], choice[L] = switch + token, best_prev
+        cost = new_cost
+        back.append(choice)
+    L = min(cost, key=cost.get)
+    lengths = list()
+    for choice in reversed(back):
+        lengths.append(L)
+        L = choice[L]
+    lengths.reverse()
+    return lengths
+
+
+def emit(events, tempo=DEFAULT_TEMPO, volume=None):
+    """
+    Writes events as ArduPilot MML, starting from the player defaults (with
+    the given tempo and volume already set).
+    """
+    timed = [e for e in events if e.kind in ("note", "number")]
+    lengths = iter(choose_lengths([e.pieces[0][0] for e in timed], [e.kind == "number" for e in timed]))
+
+    state = {"t": str(tempo), "v": None if volume is None else str(volume), "mn": "mn", "mb": "mf"}
+    pending = dict()
+    octave = DEFAULT_OCTAVE
+    default_length = DEFAULT_LENGTH
+    out = list()
+    for event in events:
+        if event.kind == "state":
+            pending.pop(event.pitch, None)
+            pending[event.pitch] = event.text
+            continue
+        for key, text in pending.items():
+            if state.get(key) != text:
+                out.append(text if key.startswith("m") else key + text)
+                state[key] = text
+        pending.clear()
+
+        if event.kind == "raw":
+            out.append(event.text)
+            continue
+        value, dots = event.pieces[0]
+        if event.kind == "tie":
+            out.append(f"^{value}" + "." * dots)
+            continue
+        if event.kind == "rest":
+            out.append(rest_text(value, dots))
+            continue
+        L = next(lengths)
+        if L != default_length:
+            out.append(f"l{L}")
+            default_length = L
+        number = "" if value == L else str(value)
+        if event.kind == "number":
+            out.append(f"n{event.pitch}" + "." * dots)
+        else:
+            target = min(max(event.pitch // 12, MIN_OCTAVE), MAX_OCTAVE)
+            if event.pitch - 12 * octave in NOTE_NAMES:
+                # c- and b+ reach one semitone past the current octave
+                target = octave
+            step = target - octave
+            if step == 1:
+                out.append(">")
+            elif step == -1:
+                out.append("<")
+            elif step:
+                out.append(f"o{target}")
+            octave = target
+            out.append(NOTE_NAMES[event.pitch - 12 * octave] + number + "." * dots)
+    # state commands after the last note change nothing and are dropped
+    return "".join(out)
+
+
+def optimize(melody, tempo=DEFAULT_TEMPO, volume=None):
+    """
+    Returns the shortest equivalent form of an ArduPilot MML melody that
+    optimize finds. tempo and volume are the values already in effect when
+    the melody starts (e.g. set by the segment prefix).
+    """
+    return emit(merge(parse(melody)), tempo, volume)
+
+
+if __name__ == "__main__":
+    for melody in sys.argv[1:]:
+        result = optimize(melody)
+        print(f"{len(melody)} -> {len(result)} characters")
+        print(result)
@@ -1,160 +1,286 @@
 import os
+import sys
 import asyncio
+import logging
+import argparse
 os.environ['MAVLINK20'] = '1'
 os.environ['MAVLINK_DIALECT'] = 'all'
+import numpy as np
 import pymavlink.mavutil as mavutil
 from pymavlink.dialects.v20 import common as mavlink
 
+from mml_duration import segment_times
+from mml_lexer import tokenize
+from mml_optimizer import optimize
+from profiling import profiler
+import show_file
+from tune_transport import DEFAULT_TARGET, transport_for
+
+log = logging.getLogger(__name__)
+
 MAX_CHUNK_LENGTH = 40
-DURATION_SCALE = 0.14
-
-
-def get_next_command(s, start_index):
-    """
-    Reads the next MML command from s starting at start_index.
-    A command is either:
-      - A tempo command: 't' followed by digits.
-      - A note/rest: one letter in [a,b,c,d,e,f,g,h,p] (case-insensitive),
-        optionally a '#' for accidental, then digits.
-    Returns a tuple (command_string, next_index).
-    """
-    if s[start_index].lower() == 't':
-        i = start_index + 1
-        while i < len(s) and s[i].isdigit():
-            i += 1
-        return s[start_index:i], i
-    elif s[start_index].lower() in 'abcdefgpr':
-        i = start_index + 1
-        if i < len(s) and s[i] in ['#', '+', '-']:
-            i += 1
-        while i < len(s) and (s[i].isdigit() or s[i] == '.'):
-            i += 1
-        return s[start_index:i], i
-    else:
-        # Unknown character; return it and advance.
-        return s[start_index], start_index + 1
+# segments are sent this many seconds ahead of their deadline, to make up
+# for the latency of the link
+LEAD_TIME = 0.02
+# segments sent later than this (seconds) are logged as warnings
+LATE_WARNING = 0.05
+# player state segment_mml carries over from one segment to the next
+RESTORED_STATE = ('t', 'v', 'mn', 'mb', 'o', 'l')
+OVERRIDING_KINDS = {'tempo': 't', 'volume': 'v', 'octave': 'o', 'length': 'l'}
 
 
 def segment_mml(melody, max_length, prefix=''):
     """
     Splits the full MML melody string into segments no longer than max_length,
-    ensuring that commands are not split. Each segment will start with the most
-    recent tempo command.
+    ensuring that commands are not split. Every segment starts with prefix.
+
+    The MMLPlayer starts over from its defaults with every PLAY_TUNE, so a
+    segment also restates the octave, default length, tempo, volume and mode
+    the melody has left in effect before it. State commands stay in the
+    segment of the note or rest that follows them, so no segment is made of
+    state alone. Raises ValueError if a note with its restated state does
+    not fit into max_length.
     """
+    # every note or rest with the commands before it and its ties, together
+    # with the state in effect before them
+    units = []
+    state = dict.fromkeys(RESTORED_STATE, '')
+    octave = 4
+    unit = []
+    for token in tokenize(melody):
+        kind = token.kind
+        if kind == 'tie' and units and not unit:
+            units[-1][1].append(token)
+            continue
+        if not unit:
+            before = dict(state)
+        unit.append(token)
+        if kind in ('note', 'rest', 'note_number', 'tie'):
+            units.append((before, unit))
+            unit = []
+        elif kind in ('octave', 'octave_up', 'octave_down'):
+            if kind == 'octave_up':
+                octave += 1
+            elif kind == 'octave_down':
+                octave -= 1
+            elif token.length is not None:
+                octave = token.length
+            octave = min(max(octave, 0), 6)
+            state['o'] = '' if octave == 4 else f'o{octave}'
+        elif kind == 'length' and token.length:
+            state['l'] = '' if token.length == 4 else f'l{token.length}'
+        elif kind == 'tempo' and token.length:
+            state['t'] = f't{token.length}'
+        elif kind == 'volume' and token.length is not None:
+            state['v'] = f'v{token.length}'
+        elif kind == 'mode':
+            mode = token.text.lower()
+            if mode in ('mf', 'mb'):
+                state['mb'] = '' if mode == 'mf' else mode
+            else:
+                state['mn'] = '' if mode == 'mn' else mode
+    # state commands after the last note change nothing and are dropped
+
     segments = []
-    current_segment = prefix
-    index = 0
-    melody_len = len(melody)
-
-    while index < melody_len:
-        cmd, next_index = get_next_command(melody, index)
-        # If adding this command would exceed max_length, finish the current segment.
-        if len(current_segment) + len(cmd) > max_length:
+    current_segment = ''
+    for before, tokens in units:
+        text = ''.join(token.text for token in tokens)
+        if current_segment and len(current_segment) + len(text) <= max_length:
+            current_segment += text
+            continue
+        if current_segment:
             segments.append(current_segment)
-            # Start a new segment. If the command is not a tempo command, prepend the last tempo.
-            current_segment = prefix + cmd
-            index = next_index
-        else:
-            current_segment += cmd
-            index = next_index
-
+        # a command that sets a state itself makes restoring it pointless
+        overridden = {OVERRIDING_KINDS.get(token.kind) for token in tokens
+                      if token.length or (token.length == 0 and token.kind in ('octave', 'volume'))}
+        current_segment = prefix + ''.join(value for key, value in before.items() if key not in overridden) + text
+        if len(current_segment) > max_length:
+            raise ValueError(f"segment {current_segment!r} is longer than {max_length} characters")
     if current_segment:
         segments.append(current_segment)
     return segments
 
 
-def calculate_mml_duration(mml_segment, starting_tempo=120):
-    """
-    Parses the MML segment and computes an approximate playback duration (in seconds)
-    using the formula:
-        whole_note_duration = 240 / tempo   (seconds)
-        note_duration = whole_note_duration / note_value
-    (This raw calculation does not account for the firmware’s internal shortening.)
-    Returns (total_duration, final_tempo).
-    """
-
-    print(f'CALC DUR WITH TEMPO: {starting_tempo}, segment: {mml_segment}')
-    current_tempo = starting_tempo
-    total_duration = 0.0
-    index = 0
-    while index < len(mml_segment):
-        ch = mml_segment[index].lower()
-        if ch == 't':  # tempo change
-            index += 1
-            tempo_digits = ""
-            while index < len(mml_segment) and mml_segment[index].isdigit():
-                tempo_digits += mml_segment[index]
-                index += 1
-            if tempo_digits:
-                current_tempo = int(tempo_digits)
-        elif ch in 'abcdefgpr':  # note or rest command
-            index += 1
-            if index < len(mml_segment) and mml_segment[index] in ['#', '+', '-']:
-                index += 1
-
-            num_str = ""
-            while index < len(mml_segment) and mml_segment[index].isdigit():
-                num_str += mml_segment[index]
-                index += 1
-
-            note_val = int(num_str) if num_str else 4
-            duration = 240 / (current_tempo * note_val)
-
-            dot_dur = duration * 0.5
-            while index < len(mml_segment) and mml_segment[index] == '.':
-                duration += dot_dur
-                dot_dur *= 0.5
-                index += 1
-
-            total_duration += duration
-        else:
-            index += 1
-    return total_duration, current_tempo
+async def send_segment(conn, segment, target=DEFAULT_TARGET):
+    """
+    Sends one MML segment to the drone via MAVLink.
+    """
+    send_payload(conn, segment.encode('utf-8'), target)
 
 
-async def send_segment(conn, segment):
+def send_payload(conn, payload, target=DEFAULT_TARGET):
     """
-    Sends one MML segment to the drone via MAVLink.
+    Sends an already encoded MML segment to the drone target, a
+    (target_system, target_component) pair, as PLAY_TUNE_V2 if the drone
+    supports it (see tune_transport).
+    """
+    transport_for(conn, *target).send(payload)
+
+
+def check_payloads(conn, schedule, legacy_length=MAX_CHUNK_LENGTH, target=DEFAULT_TARGET):
+    """
+    Raises ValueError if a precompiled segment is too long for the drone.
     """
-    print('play tune', segment.encode('utf-8'), len(segment.encode('utf-8')))
-    conn.mav.play_tune_send(1, 1, "".encode('utf-8'), segment.encode('utf-8'))
+    limit = transport_for(conn, *target).max_length(legacy_length)
+    longest = max((len(payload) for send_time, duration, payload in schedule), default=0)
+    if longest > limit:
+        raise ValueError(f"the show has segments of {longest} characters, the drone takes {limit}; "
+                         f"compile it with max_length {limit}")
 
 
-async def play_tune_async(conn, melody, max_length=MAX_CHUNK_LENGTH, tempo=120, volume=None):
+def segment_prefix(tempo=120, volume=None):
+    """
+    Returns the prefix every segment of a melody starts with.
+    """
     if not tempo or not isinstance(tempo, int) or tempo > 255:
         raise ValueError('Wrong tempo value')
 
-    segment_prefix = f't{tempo}'
+    prefix = f't{tempo}'
     if volume:
-        segment_prefix += f'v{volume} '
+        prefix += f'v{volume} '
+    return prefix
+
 
-    segments = segment_mml(melody, max_length, prefix=segment_prefix)
+async def play_tune_async(conn, melody, max_length=MAX_CHUNK_LENGTH, tempo=120, volume=None, lead_time=LEAD_TIME,
+                          optimize_mml=True, target=DEFAULT_TARGET):
+    prefix = segment_prefix(tempo, volume)
+    max_length = transport_for(conn, *target).max_length(max_length)
 
-    print("Segmented MML Commands:")
-    for i, seg in enumerate(segments):
-        print(f"Segment {i + 1}: {seg}, {len(seg)}")
+    if optimize_mml:
+        with profiler.stage("optimize"):
+            optimized = optimize(melody, tempo, volume)
+        log.info("optimized melody from %d to %d characters", len(melody), len(optimized))
+        melody = optimized
 
-    starting_tempo = tempo
-    for i, segment in enumerate(segments):
-        raw_duration, ending_tempo = calculate_mml_duration(segment[len(segment_prefix):], starting_tempo)
-        wait_time = (raw_duration * DURATION_SCALE) + 0.1  # add a small 0.1 sec buffer
-        print(f"Sending segment {i + 1} (raw duration: {raw_duration:.2f} sec, waiting {wait_time:.2f} sec)")
-        await send_segment(conn, segment)
-        await asyncio.sleep(raw_duration)
-        starting_tempo = ending_tempo
-    print("Finished sending all segments.")
+    with profiler.stage("segment_mml"):
+        segments = segment_mml(melody, max_length, prefix=prefix)
 
+    if log.isEnabledFor(logging.DEBUG):
+        for i, seg in enumerate(segments):
+            log.debug("segment %d: %s, %d", i + 1, seg, len(seg))
+
+    with profiler.stage("segment_times"):
+        times = segment_times(segments)
+
+    schedule = list(zip(times[:-1].tolist(), np.diff(times).tolist(),
+                        [segment.encode('utf-8') for segment in segments]))
+    return await stream_segments(conn, schedule, lead_time, target=target)
+
+
+async def play_show_async(conn, schedule, lead_time=LEAD_TIME, target=DEFAULT_TARGET):
+    """
+    Streams the precompiled segments of one drone of a show file (see
+    show_file.Show.schedule).
+    """
+    check_payloads(conn, schedule, target=target)
+    return await stream_segments(conn, schedule, lead_time, target=target)
+
+
+async def stream_segments(conn, schedule, lead_time=LEAD_TIME, start=None, target=DEFAULT_TARGET, transport=None):
+    """
+    Sends the segments of a schedule, a list of (send_time, duration,
+    payload) with send times in seconds after start (a loop.time() value,
+    defaults to now), to the drone target on conn, or through transport
+    (e.g. a tune_transport.TransportGroup) if given.
+
+    Every segment has an absolute deadline on the monotonic clock of the
+    event loop and is sent lead_time seconds ahead of it, so send latency
+    and jitter never add up over the tune. A segment that is sent late
+    simply cuts into the time of the next one, which stays on its own
+    deadline. A segment whose time is completely over when it is due is
+    skipped. Returns the lateness of every segment in seconds (None for the
+    skipped ones).
+    """
+    loop = asyncio.get_running_loop()
+    if start is None:
+        start = loop.time()
+    if transport is None:
+        transport = transport_for(conn, *target)
+    lateness = []
+    for i, (send_time, duration, payload) in enumerate(schedule):
+        deadline = start + send_time
+        delay = deadline - lead_time - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        now = loop.time()
+        late = now - (deadline - lead_time)
+        if now >= deadline + duration:
+            log.warning("skipping segment %d, %.3f sec late", i + 1, late)
+            lateness.append(None)
+            continue
+        if late > LATE_WARNING:
+            log.warning("segment %d is %.3f sec late", i + 1, late)
+        else:
+            log.debug("sending segment %d (duration: %.2f sec, %.1f ms late)", i + 1, duration, late * 1e3)
+        with profiler.stage("send_segment"):
+            transport.send(payload)
+        lateness.append(late)
+
+    if schedule:
+        send_time, duration, payload = schedule[-1]
+        await asyncio.sleep(max(0.0, start + send_time + duration - loop.time()))
+    sent = [late for late in lateness if late is not None]
+    if sent:
+        log.info("finished sending all segments, lateness mean %.1f ms, max %.1f ms, %d skipped",
+                 1e3 * sum(sent) / len(sent), 1e3 * max(sent), len(lateness) - len(sent))
+    return lateness
+
+
+def connect(link):
+    """
+    Establishes the MAVLink connection to a drone.
+    """
+    src_system = mavlink.MAV_COMP_ID_USER1
+    return mavutil.mavlink_connection(link, baud=115200,
+                                      source_system=90,
+                                      source_component=src_system)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Play an MML melody on a drone via PLAY_TUNE.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every segment")
+    parser.add_argument("-q", "--quiet", action="store_true", help="log warnings and errors only")
+    parser.add_argument("--profile", action="store_true", help="print time and memory of every stage at the end")
+    parser.add_argument("--show", help="play a drone of a compiled show file (see show_file.py)")
+    parser.add_argument("--drone", default="0", help="name or index of the drone in the show (default: 0)")
+    parser.add_argument("--lead-time", type=float, default=LEAD_TIME,
+                        help="send every segment this many seconds ahead of its deadline (default: %(default)s)")
+    parser.add_argument("--link", help="MAVLink connection string, defaults to the link of the drone in the show")
+    parser.add_argument("--target-system", type=int,
+                        help="MAVLink system id of the drone, defaults to the one in the show or 1")
+    parser.add_argument("--target-component", type=int,
+                        help="MAVLink component id of the drone, defaults to the one in the show or 1")
+    parser.add_argument("--no-optimize", dest="optimize", action="store_false",
+                        help="send the melody as it is written instead of optimizing it (see mml_optimizer.py)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    level = logging.DEBUG if args.verbose else logging.WARNING if args.quiet else logging.INFO
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.profile:
+        profiler.enable()
 
-def main():
     # Set MAVLink environment variables.
     os.environ['MAVLINK20'] = '1'
     os.environ['MAVLINK_DIALECT'] = 'all'
-    # Establish MAVLink connection.
     real_link = 'udpout:192.168.0.123:14561'
-    src_system = mavlink.MAV_COMP_ID_USER1
-    conn = mavutil.mavlink_connection(real_link, baud=115200,
-                                      source_system=90,
-                                      source_component=src_system)
+    target_system, target_component = DEFAULT_TARGET
+
+    if args.show:
+        with show_file.load(args.show) as show:
+            drone = int(args.drone) if args.drone.isdigit() else show.drone_index(args.drone)
+            schedule = show.schedule(drone)
+            real_link = args.link or show.drones[drone]["link"].decode() or real_link
+            target_system = int(show.drones[drone]["system"])
+            target_component = int(show.drones[drone]["component"])
+        target = (args.target_system or target_system, args.target_component or target_component)
+        asyncio.run(play_show_async(connect(real_link), schedule, args.lead_time, target))
+        profiler.report()
+        return
+
+    conn = connect(args.link or real_link)
 
     tempo = 60
     volume = 14
@@ -170,9 +296,13 @@ def main():
         conn,
         melody,
         tempo=tempo,
-        volume=volume
+        volume=volume,
+        lead_time=args.lead_time,
+        optimize_mml=args.optimize,
+        target=(args.target_system or target_system, args.target_component or target_component)
     ))
+    profiler.report()
 
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv[1:])
@@ -0,0 +1,107 @@
+"""
+Per-stage profiling for the converter and the players.
+
+The module holds one Profiler instance, `profiler`. Code marks its stages with
+
+    with profiler.stage("read_midi"):
+        ...
+
+As long as the profiler is not enabled, stage() hands out one shared no-op
+context manager, so the hooks cost next to nothing. After enable() every stage
+records its call count, wall time and the peak of traced memory while it ran
+(tracemalloc). report() prints a table of all stages. Stages recorded in worker
+processes are handed back with take() and added up with merge().
+"""
+import sys
+import time
+import threading
+import tracemalloc
+import contextlib
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class StageStats:
+    __slots__ = ("calls", "seconds", "peak")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak = 0
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.stages = dict()
+        self._lock = threading.Lock()
+
+    def enable(self, memory=True):
+        """
+        Starts recording. With memory=True tracemalloc is started as well,
+        which slows Python allocations down noticeably.
+        """
+        self.enabled = True
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name):
+        """
+        Returns a context manager which accounts the enclosed code to the
+        stage name. Stages should not be nested, the memory peak of the inner
+        stage would reset the one of the outer stage.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._record(name)
+
+    @contextlib.contextmanager
+    def _record(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - base if tracing else 0
+            with self._lock:
+                stats = self.stages.setdefault(name, StageStats())
+                stats.calls += 1
+                stats.seconds += elapsed
+                stats.peak = max(stats.peak, peak)
+
+    def take(self):
+        """
+        Returns the stages recorded so far and starts over with none.
+        """
+        with self._lock:
+            stages, self.stages = self.stages, dict()
+        return stages
+
+    def merge(self, stages):
+        """
+        Adds stages recorded elsewhere (see take), e.g. in a worker process.
+        """
+        with self._lock:
+            for name, other in stages.items():
+                stats = self.stages.setdefault(name, StageStats())
+                stats.calls += other.calls
+                stats.seconds += other.seconds
+                stats.peak = max(stats.peak, other.peak)
+
+    def report(self, file=sys.stderr):
+        """
+        Prints calls, total and mean wall time and peak memory of every stage.
+        """
+        if not self.stages:
+            return
+        print(f"{'stage':<28}{'calls':>8}{'total s':>12}{'mean ms':>12}{'peak MiB':>11}", file=file)
+        for name, stats in self.stages.items():
+            mean = 1e3 * stats.seconds / stats.calls
+            print(f"{name:<28}{stats.calls:>8}{stats.seconds:>12.4f}{mean:>12.3f}{stats.peak / 2**20:>11.2f}", file=file)
+
+
+profiler = Profiler()
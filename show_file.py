@@ -0,0 +1,279 @@
+"""
+Precompiled show files.
+
+A show is a set of drones, each with its own MML melody, tempo, volume,
+start offset and MAVLink target (system and component id, so several drones
+can share one link). Compiling a show segments every melody and computes the
+duration and send time of every segment once, the players then only stream
+the stored payloads. Melodies are run through mml_optimizer first unless
+"optimize" is false. The show is described in JSON:
+
+    {
+      "max_length": 40,
+      "optimize": true,
+      "drones": [
+        {"name": "lead", "link": "udpout:192.168.0.160:14561", "system": 1, "component": 1,
+         "melody": "a1r8c+8<b8>c+8", "tempo": 140, "volume": 40, "start": 0.0}
+      ]
+    }
+
+and compiled into a little-endian binary file:
+
+    header     magic b"MMLS", version, number of drones, number of segments,
+               size of the payload blob (HEADER)
+    drones     one DRONE_DTYPE record per drone
+    segments   one SEGMENT_DTYPE record per segment, grouped by drone and
+               ordered by send time
+    payload    the MML of all segments, back to back, every distinct
+               segment stored once
+
+Send times are seconds after the start of the show and already include the
+start offset of the drone. load() memory-maps the file, the tables are NumPy
+views on the mapping.
+
+    python show_file.py compile show.json -o show.mmls
+    python show_file.py info show.mmls
+"""
+import sys
+import json
+import mmap
+import struct
+import argparse
+
+import numpy as np
+
+MAGIC = b"MMLS"
+VERSION = 3
+HEADER = struct.Struct("<4sHHII")
+
+DRONE_DTYPE = np.dtype([
+    ("name", "S64"),
+    ("link", "S256"),
+    ("start", "<f8"),
+    ("first_segment", "<u4"),
+    ("segments", "<u4"),
+    ("tempo", "<u2"),
+    ("volume", "<u2"),
+    ("system", "u1"),
+    ("component", "u1"),
+])
+
+SEGMENT_DTYPE = np.dtype([
+    ("send_time", "<f8"),
+    ("duration", "<f8"),
+    ("offset", "<u4"),
+    ("length", "<u2"),
+    ("drone", "<u2"),
+])
+
+
+class ShowFileError(ValueError):
+    pass
+
+
+def encode_field(text, field, drone):
+    """
+    Encodes text for a string field of DRONE_DTYPE. Raises ShowFileError if
+    it does not fit, a cut off link would open another device.
+    """
+    data = text.encode("utf-8")
+    size = DRONE_DTYPE[field].itemsize
+    if len(data) > size:
+        raise ShowFileError(f"{field} of drone {drone} is {len(data)} bytes long, at most {size} fit: {text}")
+    return data
+
+
+def show_bytes(config):
+    """
+    Compiles a show given as a dict (see the module docstring) and returns
+    the content of its show file.
+    """
+    # the players import pymavlink, which is only needed here for segmenting
+    import play_tune
+    from mml_duration import segment_times
+    from mml_optimizer import optimize
+
+    max_length = config.get("max_length", play_tune.MAX_CHUNK_LENGTH)
+    optimize_mml = config.get("optimize", True)
+    drones = np.zeros(len(config["drones"]), dtype=DRONE_DTYPE)
+    segments = list()
+    payload = bytearray()
+    # drones playing the same part are segmented once and share the payload
+    parts = dict()
+    offsets = dict()
+    for i, drone in enumerate(config["drones"]):
+        tempo = drone.get("tempo", 120)
+        volume = drone.get("volume")
+        start = float(drone.get("start", 0.0))
+        part = (drone["melody"], tempo, volume)
+        if part not in parts:
+            prefix = play_tune.segment_prefix(tempo, volume)
+            melody = optimize(drone["melody"], tempo, volume) if optimize_mml else drone["melody"]
+            texts = play_tune.segment_mml(melody, max_length, prefix=prefix)
+            data = [text.encode("utf-8") for text in texts]
+            for d in data:
+                if d not in offsets:
+                    offsets[d] = len(payload)
+                    payload += d
+            parts[part] = (segment_times(texts), [offsets[d] for d in data], [len(d) for d in data])
+        times, offset, length = parts[part]
+
+        table = np.zeros(len(offset), dtype=SEGMENT_DTYPE)
+        table["send_time"] = start + times[:-1]
+        table["duration"] = np.diff(times)
+        table["drone"] = i
+        table["length"] = length
+        table["offset"] = offset
+
+        drones[i] = (encode_field(drone.get("name", f"drone {i}"), "name", i),
+                     encode_field(drone.get("link", ""), "link", i),
+                     start, sum(len(s) for s in segments), len(table), tempo, volume or 0,
+                     drone.get("system", 1), drone.get("component", 1))
+        segments.append(table)
+
+    segments = np.concatenate(segments) if segments else np.zeros(0, dtype=SEGMENT_DTYPE)
+    return b"".join([HEADER.pack(MAGIC, VERSION, len(drones), len(segments), len(payload)),
+                     drones.tobytes(), segments.tobytes(), payload])
+
+
+def compile_show(config, output):
+    """
+    Compiles a show given as a dict into the binary file output.
+    """
+    data = show_bytes(config)
+    with open(output, "wb") as f:
+        f.write(data)
+
+
+def compile_show_file(config_file, output):
+    with open(config_file) as f:
+        compile_show(json.load(f), output)
+
+
+class Show:
+    """
+    A memory-mapped show file, or a show compiled in memory by
+    from_config(). drones and segments are structured arrays (DRONE_DTYPE,
+    SEGMENT_DTYPE) backed by the file.
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ShowFileError(f"{filename} is empty")
+        self._parse(filename)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Compiles a show config in memory, without a show file.
+        """
+        show = cls.__new__(cls)
+        show._file = None
+        show._mmap = show_bytes(config)
+        show._parse("show config")
+        return show
+
+    def _parse(self, filename):
+        if len(self._mmap) < HEADER.size:
+            self.close()
+            raise ShowFileError(f"{filename} is not a show file")
+        magic, version, drones, segments, payload_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ShowFileError(f"{filename} is not a show file of version {VERSION}")
+        offset = HEADER.size
+        self.drones = np.frombuffer(self._mmap, DRONE_DTYPE, drones, offset)
+        offset += drones * DRONE_DTYPE.itemsize
+        self.segments = np.frombuffer(self._mmap, SEGMENT_DTYPE, segments, offset)
+        self._payload = offset + segments * SEGMENT_DTYPE.itemsize
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.drones = self.segments = None
+        if self._file is None:
+            return
+        try:
+            self._mmap.close()
+        except BufferError:
+            # views on the tables are still alive, the mapping goes away
+            # together with the last of them
+            pass
+        self._file.close()
+
+    def drone_index(self, name):
+        """
+        Returns the index of the drone with the given name.
+        """
+        names = self.drones["name"].tolist()
+        try:
+            return names.index(name.encode("utf-8"))
+        except ValueError:
+            raise KeyError(name) from None
+
+    def drone_segments(self, drone):
+        """
+        Returns the segment table of one drone (a view, no copy).
+        """
+        first = int(self.drones[drone]["first_segment"])
+        return self.segments[first:first + int(self.drones[drone]["segments"])]
+
+    def payload(self, segment):
+        """
+        Returns the MML bytes of a segment record.
+        """
+        start = self._payload + int(segment["offset"])
+        return self._mmap[start:start + int(segment["length"])]
+
+    def schedule(self, drone):
+        """
+        Returns the list of (send_time, duration, payload) of one drone,
+        ready to be streamed.
+        """
+        table = self.drone_segments(drone)
+        return list(zip(table["send_time"].tolist(), table["duration"].tolist(),
+                        [self.payload(segment) for segment in table]))
+
+
+def load(filename):
+    return Show(filename)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compile and inspect show files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="compile a JSON show into a show file")
+    compile_parser.add_argument("config")
+    compile_parser.add_argument("-o", "--output", required=True)
+    info_parser = commands.add_parser("info", help="print the drones and segments of a show file")
+    info_parser.add_argument("show")
+    info_parser.add_argument("--segments", action="store_true", help="list every segment")
+    args = parser.parse_args(argv)
+
+    if args.command == "compile":
+        compile_show_file(args.config, args.output)
+        return 0
+    with load(args.show) as show:
+        for i, drone in enumerate(show.drones):
+            table = show.drone_segments(i)
+            end = float(table["send_time"][-1] + table["duration"][-1]) if len(table) else drone["start"]
+            print(f"{i:>3} {drone['name'].decode():<16} {drone['link'].decode():<28} "
+                  f"{drone['system']:>3}/{drone['component']:<3} "
+                  f"start {drone['start']:7.2f} s  end {end:8.2f} s  {drone['segments']} segments")
+            if args.segments:
+                for segment in table:
+                    print(f"      {segment['send_time']:8.3f} s  {segment['duration']:6.3f} s  "
+                          f"{show.payload(segment).decode()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
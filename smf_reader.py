@@ -0,0 +1,177 @@
+"""
+Standard MIDI File reader based on NumPy.
+
+mido creates one Python object per event, which dominates the time and memory
+needed to load large multitrack files. read_smf() memory-maps the file and
+decodes the delta times (variable length quantities) and running status of
+every track into flat arrays instead. Only channel messages end up in the
+event table; of the meta events the tempo changes and track names are kept,
+system exclusive and all other meta events are skipped.
+
+    smf = read_smf("song.mid")
+    smf.events["tick"], smf.events["status"], smf.events["data1"], ...
+
+The events are ordered by track and, within a track, by time. Note-on
+messages with velocity 0 are left as they are.
+"""
+import mmap
+import struct
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+EVENT_DTYPE = np.dtype([
+    ("tick", np.int64),
+    ("status", np.uint8),
+    ("data1", np.uint8),
+    ("data2", np.uint8),
+    ("track", np.uint16),
+])
+
+TEMPO_DTYPE = np.dtype([
+    ("tick", np.int64),
+    ("tempo", np.int64),
+    ("track", np.uint16),
+])
+
+SMF = namedtuple("SMF", ["format", "PPQ", "events", "tempo", "names"])
+
+META = 0xFF
+SYSEX = 0xF0
+SYSEX_ESCAPE = 0xF7
+META_TRACK_NAME = 0x03
+META_END_OF_TRACK = 0x2F
+META_SET_TEMPO = 0x51
+
+
+class SMFError(ValueError):
+    pass
+
+
+def read_smf(filename):
+    """
+    Reads a MIDI file into an SMF tuple:
+      format  SMF format (0, 1 or 2)
+      PPQ     ticks per quarter note
+      events  structured array of EVENT_DTYPE, one row per channel message
+      tempo   structured array of TEMPO_DTYPE, one row per set_tempo event
+      names   list with the name of every track (its last track_name
+              event), "NA" for tracks without one
+    """
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = memoryview(mm)
+            try:
+                return parse_smf(data)
+            finally:
+                data.release()
+
+
+def parse_smf(data):
+    """
+    Parses the bytes of a MIDI file (anything that supports the buffer
+    protocol), see read_smf().
+    """
+    if bytes(data[:4]) != b"MThd":
+        raise SMFError("not a standard MIDI file")
+    length, fmt, ntracks, division = struct.unpack_from(">IHHH", data, 4)
+    if division & 0x8000:
+        raise SMFError("SMPTE time division is not supported")
+
+    ticks, status, data1, data2, tracks = array("q"), array("B"), array("B"), array("B"), array("H")
+    tempo_ticks, tempo_values, tempo_tracks = array("q"), array("q"), array("H")
+    names = list()
+
+    pos = 8 + length
+    track = 0
+    while pos + 8 <= len(data) and track < ntracks:
+        chunk_type = bytes(data[pos:pos+4])
+        (length,) = struct.unpack_from(">I", data, pos + 4)
+        pos += 8
+        if chunk_type == b"MTrk":
+            n = len(ticks)
+            name, tempo = _parse_track(data, pos, min(pos + length, len(data)), ticks, status, data1, data2)
+            tracks.extend([track] * (len(ticks) - n))
+            for tick, value in tempo:
+                tempo_ticks.append(tick)
+                tempo_values.append(value)
+                tempo_tracks.append(track)
+            names.append(name)
+            track += 1
+        pos += length
+
+    events = np.empty(len(ticks), dtype=EVENT_DTYPE)
+    events["tick"] = np.frombuffer(ticks, dtype=np.int64)
+    events["status"] = np.frombuffer(status, dtype=np.uint8)
+    events["data1"] = np.frombuffer(data1, dtype=np.uint8)
+    events["data2"] = np.frombuffer(data2, dtype=np.uint8)
+    events["track"] = np.frombuffer(tracks, dtype=np.uint16)
+    tempo = np.empty(len(tempo_ticks), dtype=TEMPO_DTYPE)
+    tempo["tick"] = np.frombuffer(tempo_ticks, dtype=np.int64)
+    tempo["tempo"] = np.frombuffer(tempo_values, dtype=np.int64)
+    tempo["track"] = np.frombuffer(tempo_tracks, dtype=np.uint16)
+    return SMF(fmt, division, events, tempo, names)
+
+
+def _parse_track(data, pos, end, ticks, status, data1, data2):
+    # Decodes one MTrk chunk and appends its channel messages to the
+    # arrays. Returns the track name and a list of (tick, tempo). This
+    # loop is the hot path, it deliberately only deals with integers.
+    name = "NA"
+    tempo = list()
+    tick = 0
+    running = 0
+    while pos < end:
+        b = data[pos]
+        pos += 1
+        delta = b & 0x7F
+        while b & 0x80:
+            b = data[pos]
+            pos += 1
+            delta = (delta << 7) | (b & 0x7F)
+        tick += delta
+
+        b = data[pos]
+        if b & 0x80:
+            pos += 1
+            running = b
+        elif running == 0:
+            raise SMFError(f"data byte without status at offset {pos}")
+
+        if running < SYSEX:
+            ticks.append(tick)
+            status.append(running)
+            data1.append(data[pos])
+            # program change and channel pressure carry a single data byte
+            if running & 0xE0 == 0xC0:
+                data2.append(0)
+                pos += 1
+            else:
+                data2.append(data[pos + 1])
+                pos += 2
+            continue
+
+        meta_type = -1
+        if running == META:
+            meta_type = data[pos]
+            pos += 1
+        elif running != SYSEX and running != SYSEX_ESCAPE:
+            raise SMFError(f"unexpected status byte {running:#x} at offset {pos - 1}")
+        b = data[pos]
+        pos += 1
+        length = b & 0x7F
+        while b & 0x80:
+            b = data[pos]
+            pos += 1
+            length = (length << 7) | (b & 0x7F)
+        if meta_type == META_SET_TEMPO:
+            tempo.append((tick, int.from_bytes(data[pos:pos+length], "big")))
+        elif meta_type == META_TRACK_NAME:
+            name = bytes(data[pos:pos+length]).decode("latin-1")
+        elif meta_type == META_END_OF_TRACK:
+            break
+        pos += length
+        # system exclusive and meta events cancel the running status
+        running = 0
+    return name, tempo
@@ -0,0 +1,86 @@
+"""
+Tempo map shared by the converter and the players.
+
+A TempoMap is built once per file (or melody) from its tempo changes. It keeps
+the tick of every change together with the number of seconds elapsed up to
+it, so converting positions between ticks and seconds is a binary search
+(np.searchsorted) plus one multiplication, for single values as well as whole
+arrays of positions.
+
+Tempos are given in microseconds per quarter note like in MIDI, from_bpm()
+builds a map from beats per minute instead. Ticks may be fractional.
+"""
+import numpy as np
+
+# MIDI default if a file has no set_tempo event: 120 BPM
+DEFAULT_TEMPO = 500000
+
+
+class TempoMap:
+    def __init__(self, ticks, tempo, PPQ=48):
+        """
+        ticks and tempo are the positions and the new tempos (microseconds
+        per quarter) of the tempo changes, in any order. Of several changes
+        at the same tick the last one wins. Before the first change the
+        default tempo of 120 BPM applies.
+        """
+        ticks = np.asarray(ticks, dtype=np.float64)
+        tempo = np.asarray(tempo, dtype=np.float64)
+        order = np.argsort(ticks, kind="stable")
+        ticks, tempo = ticks[order], tempo[order]
+        last = np.append(ticks[1:] != ticks[:-1], True)
+        ticks, tempo = ticks[last], tempo[last]
+        if len(ticks) == 0 or ticks[0] > 0:
+            ticks = np.insert(ticks, 0, 0.0)
+            tempo = np.insert(tempo, 0, DEFAULT_TEMPO)
+        self.PPQ = PPQ
+        self.ticks = ticks
+        self.tempo = tempo
+        # seconds per tick between a change and the next one
+        self.rate = tempo / (1e6 * PPQ)
+        self.seconds = np.concatenate(([0.0], np.cumsum(np.diff(ticks) * self.rate[:-1])))
+
+    @classmethod
+    def from_bpm(cls, ticks, bpm, PPQ=48):
+        return cls(ticks, 60e6 / np.asarray(bpm, dtype=np.float64), PPQ)
+
+    def __len__(self):
+        return len(self.ticks)
+
+    @property
+    def bpm(self):
+        return 60e6 / self.tempo
+
+    def to_seconds(self, ticks):
+        """
+        Converts tick positions (a number or an array) to seconds.
+        """
+        ticks = np.asarray(ticks, dtype=np.float64)
+        i = self._index(self.ticks, ticks)
+        return self.seconds[i] + (ticks - self.ticks[i]) * self.rate[i]
+
+    def to_ticks(self, seconds):
+        """
+        Converts positions in seconds (a number or an array) to ticks.
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        i = self._index(self.seconds, seconds)
+        return self.ticks[i] + (seconds - self.seconds[i]) / self.rate[i]
+
+    def tempo_at(self, ticks):
+        """
+        Returns the tempo (microseconds per quarter) in effect at the given
+        tick positions.
+        """
+        return self.tempo[self._index(self.ticks, np.asarray(ticks, dtype=np.float64))]
+
+    def changes(self):
+        """
+        Yields (tick, tempo) of every tempo change.
+        """
+        yield from zip(self.ticks.tolist(), self.tempo.tolist())
+
+    @staticmethod
+    def _index(starts, positions):
+        # index of the tempo segment every position falls into
+        return np.maximum(np.searchsorted(starts, positions, side="right") - 1, 0)
@@ -0,0 +1,91 @@
+"""
+Reference timings of the MMLPlayer.
+
+Every expected value is written out as the sound and silence of each note
+in microseconds, the way the MMLPlayer times them (see mml_duration), e.g.
+a quarter at tempo 120 in MN is 437500 us of sound and 62500 us of silence.
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mml_duration import segment_duration, segment_times
+from mml_optimizer import optimize
+
+# (segment, microseconds)
+REFERENCE = [
+    ("c", 437500 + 62500),
+    ("t60 c", 875000 + 125000),
+    ("l8 c d", 2 * (218750 + 31250)),
+    ("c0", 437500 + 62500),
+    # dots extend the sound after the articulation shortened it
+    ("c.", 437500 + 218750 + 62500),
+    ("c..", 437500 + 218750 + 109375 + 62500),
+    ("ms c", 375000 + 125000),
+    ("ms c.", 375000 + 187500 + 125000),
+    ("ml c8.", 250000 + 125000),
+    ("ml c8 mn c8 ms c8", 250000 + (218750 + 31250) + (187500 + 62500)),
+    ("mb o5 c > d < e v20 f", 4 * (437500 + 62500)),
+    ("n60", 437500 + 62500),
+    ("l16 n60.", 109375 + 54687 + 15625),
+    # rests without a length are whole rests, L does not apply to them
+    ("p", 2000000),
+    ("p0", 2000000),
+    ("l8 p", 2000000),
+    ("p2 r4", 1000000 + 500000),
+    ("p8.", 250000 + 125000),
+    ("c4^8", 437500 + 250000 + 62500),
+    ("p4^4.", 500000 + 750000),
+    ("t200 c8", 131250 + 18750),
+    # tempos below 32 and L0 stop the tune
+    ("t20 c", 0),
+    ("c t31 c", 437500 + 62500),
+    ("c l0 c", 437500 + 62500),
+    # sound and silence are whole microseconds each
+    ("t90 c8", 291666 + 41666),
+    ("t90 c8 t180 c8", (291666 + 41666) + (145833 + 20833)),
+]
+
+MELODIES = [
+    "c8 p8 d8 p8 e8 p8 f8 g8",
+    "l8 c p d p4 p4 e",
+    "l16 c d e f p8 p16 g a b > c4 p2",
+    "t140 c+8 d+8 p8. f+16 p g+4 ^8 a",
+    "ms c8 c8 ml p8 p8 p8 c4 mn n40 n41",
+    "pp",
+    "p1p1p1",
+    "c p p c",
+    "p8 p8 p8 p8 p8",
+    "l8 p p p4 p4",
+    "c-d o4 b+ c",
+]
+
+
+class TestSegmentDuration(unittest.TestCase):
+    def test_reference(self):
+        for segment, microseconds in REFERENCE:
+            with self.subTest(segment=segment):
+                self.assertAlmostEqual(segment_duration(segment), microseconds / 1e6, places=6)
+
+    def test_bytes(self):
+        self.assertEqual(segment_duration(b"t60 c"), segment_duration("t60 c"))
+
+    def test_segment_times(self):
+        times = segment_times(["c", "p", "t60 c"])
+        self.assertEqual(times.tolist(), [0.0, 0.5, 2.5, 3.5])
+
+    def test_optimize_keeps_duration(self):
+        for melody in MELODIES:
+            with self.subTest(melody=melody):
+                self.assertAlmostEqual(segment_duration(optimize(melody)), segment_duration(melody), places=6)
+
+    def test_optimize_not_longer(self):
+        for melody in MELODIES:
+            with self.subTest(melody=melody):
+                self.assertLessEqual(len(optimize(melody)), len(melody))
+
+
+if __name__ == "__main__":
+    unittest.main()
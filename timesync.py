@@ -0,0 +1,204 @@
+"""
+Clock synchronization with the drones over MAVLink TIMESYNC.
+
+Every drone sits behind its own link with its own latency, so segments sent
+at the same moment start playing at different times. measure() exchanges a
+few TIMESYNC messages with a drone: the request carries our clock (ts1), the
+drone answers with its own clock (tc1) and echoes ours, which gives the
+round trip time and the offset between the two clocks. Half the round trip
+is the one-way latency the players send ahead of time to line the drones
+up.
+
+SimulatedVehicle stands in for a drone on a local UDP port, with a
+configurable latency and jitter, so the synchronization can be tried
+without hardware:
+
+    python timesync.py simulate --port 14600 --latency 0.05 --jitter 0.005
+    python timesync.py measure udpout:127.0.0.1:14600
+"""
+import os
+import sys
+import time
+import heapq
+import random
+import logging
+import argparse
+import itertools
+import threading
+import statistics
+from collections import namedtuple
+os.environ['MAVLINK20'] = '1'
+os.environ['MAVLINK_DIALECT'] = 'all'
+import pymavlink.mavutil as mavutil
+
+log = logging.getLogger(__name__)
+
+# TIMESYNC exchanges per measurement, and how long to wait for each answer
+SAMPLES = 8
+REPLY_TIMEOUT = 0.5
+
+# rtt        median round trip time (seconds)
+# latency    one-way latency, half the median round trip
+# offset     clock of the drone minus ours, taken from the fastest exchange
+# jitter     spread of the round trip times
+# samples    number of exchanges that were answered
+LinkSync = namedtuple("LinkSync", ["rtt", "latency", "offset", "jitter", "samples"])
+
+
+def exchange(conn, timeout=REPLY_TIMEOUT, target_system=None):
+    """
+    Does one TIMESYNC round trip. Returns (rtt, offset) in seconds, or None
+    if the drone does not answer within timeout. With target_system only
+    that drone is asked and its answer counts, for links several drones
+    share.
+    """
+    ts1 = time.monotonic_ns()
+    request = conn.mav.timesync_encode(0, ts1)
+    # older dialects have no target fields, every drone answers then
+    if target_system is not None and hasattr(request, "target_system"):
+        request.target_system = target_system
+    conn.mav.send(request)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        msg = conn.recv_match(type="TIMESYNC", blocking=True, timeout=remaining)
+        if msg is None:
+            return None
+        # tc1 == 0 are requests of the drone itself, other ts1 are stale answers
+        if msg.tc1 != 0 and msg.ts1 == ts1 and target_system in (None, msg.get_srcSystem()):
+            now = time.monotonic_ns()
+            return (now - ts1) / 1e9, (msg.tc1 - (ts1 + now) / 2) / 1e9
+
+
+def measure(conn, samples=SAMPLES, timeout=REPLY_TIMEOUT, target_system=None):
+    """
+    Measures the link to a drone with several TIMESYNC exchanges and returns
+    a LinkSync. Raises TimeoutError if the drone never answers.
+    """
+    results = [result for result in (exchange(conn, timeout, target_system) for i in range(samples))
+               if result is not None]
+    if not results:
+        raise TimeoutError("no answer to TIMESYNC")
+    rtts = sorted(rtt for rtt, offset in results)
+    rtt = statistics.median(rtts)
+    # the fastest exchange was delayed least, its offset is the most accurate
+    fastest, offset = min(results)
+    sync = LinkSync(rtt, rtt / 2, offset, rtts[-1] - rtts[0], len(results))
+    log.info("rtt %.1f ms (jitter %.1f ms), clock offset %.3f s, %d/%d answers",
+             1e3 * sync.rtt, 1e3 * sync.jitter, sync.offset, sync.samples, samples)
+    return sync
+
+
+class SimulatedVehicle:
+    """
+    A drone simulated on a local UDP port. Every message takes latency plus
+    a random jitter (uniform between 0 and jitter) seconds in each
+    direction. The vehicle answers TIMESYNC with its own clock, which runs
+    clock_offset seconds ahead of time.monotonic(), and records every tune
+    it receives in tunes, as (arrival time, tune) with time.monotonic()
+    arrival times. Messages targeted at another system are ignored.
+    """
+
+    def __init__(self, port, latency=0.0, jitter=0.0, clock_offset=0.0, system=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.clock_offset = clock_offset
+        self.system = system
+        self.tunes = list()
+        self.conn = mavutil.mavlink_connection(f"udpin:127.0.0.1:{port}", source_system=system,
+                                               source_component=1)
+        self._random = random.Random(seed)
+        self._pending = list()  # heap of (due time, sequence, kind, message)
+        self._sequence = itertools.count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"vehicle {port}", daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.conn.close()
+
+    def _delay(self):
+        return self.latency + self._random.uniform(0, self.jitter)
+
+    def _schedule(self, due, kind, msg):
+        heapq.heappush(self._pending, (due, next(self._sequence), kind, msg))
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            while self._pending and self._pending[0][0] <= now:
+                due, sequence, kind, msg = heapq.heappop(self._pending)
+                if kind == "arrive":
+                    self._arrive(due, msg)
+                else:
+                    self.conn.mav.send(msg)
+            timeout = min(self._pending[0][0] - now, 0.01) if self._pending else 0.01
+            self.conn.select(max(timeout, 0))
+            while True:
+                msg = self.conn.recv_msg()
+                if msg is None:
+                    break
+                self._schedule(time.monotonic() + self._delay(), "arrive", msg)
+
+    def _arrive(self, arrival, msg):
+        kind = msg.get_type()
+        if getattr(msg, "target_system", 0) not in (0, self.system):
+            return
+        if kind == "TIMESYNC" and msg.tc1 == 0:
+            tc1 = int((arrival + self.clock_offset) * 1e9)
+            self._schedule(arrival + self._delay(), "send", self.conn.mav.timesync_encode(tc1, msg.ts1))
+        elif kind in ("PLAY_TUNE", "PLAY_TUNE_V2"):
+            tune = msg.tune if kind == "PLAY_TUNE_V2" else msg.tune + msg.tune2
+            self.tunes.append((arrival, tune))
+            log.debug("tune at %.3f: %s", arrival, tune)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Measure drone links with TIMESYNC, or simulate a drone.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    measure_parser = commands.add_parser("measure", help="measure the latency and clock offset of a link")
+    measure_parser.add_argument("link")
+    measure_parser.add_argument("-n", "--samples", type=int, default=SAMPLES)
+    simulate_parser = commands.add_parser("simulate", help="run a simulated drone on a local UDP port")
+    simulate_parser.add_argument("--port", type=int, default=14600)
+    simulate_parser.add_argument("--latency", type=float, default=0.05, help="one-way latency in seconds")
+    simulate_parser.add_argument("--jitter", type=float, default=0.005, help="random extra latency in seconds")
+    simulate_parser.add_argument("--clock-offset", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.command == "measure":
+        conn = mavutil.mavlink_connection(args.link, source_system=90, source_component=25)
+        try:
+            measure(conn, args.samples)
+        except TimeoutError as e:
+            log.error("%s: %s", args.link, e)
+            return 1
+        return 0
+
+    with SimulatedVehicle(args.port, args.latency, args.jitter, args.clock_offset):
+        log.info("simulated vehicle on udp port %d, latency %.3f s, jitter %.3f s",
+                 args.port, args.latency, args.jitter)
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
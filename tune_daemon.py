@@ -0,0 +1,355 @@
+"""
+Resident player service.
+
+Starting play_tune or play_tune_multi pays for importing pymavlink with the
+all dialect and for opening and querying every link before the first note.
+The daemon does that once and keeps the links warm: a ConnectionPool holds
+one MAVLink connection per endpoint, sends a HEARTBEAT on every connection
+once a second and reopens connections whose link failed or went silent,
+unless the playing show is using them. pymavlink connections are not
+thread-safe, so the heartbeats run on the event loop like the shows.
+Shows are cued ahead of time (loaded, connected and checked against the
+drones, see play_tune_multi.prepare_swarm), so play starts them within
+milliseconds.
+
+The daemon takes one JSON command per line on a local TCP socket and answers
+with one JSON line. The same script is the client:
+
+    python tune_daemon.py serve
+    python tune_daemon.py cue shows/trio.json
+    python tune_daemon.py play
+    python tune_daemon.py stop
+    python tune_daemon.py status
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+import contextlib
+from collections import Counter
+os.environ['MAVLINK20'] = '1'
+os.environ['MAVLINK_DIALECT'] = 'all'
+from pymavlink.dialects.v20 import common as mavlink
+
+from play_tune import LEAD_TIME, connect
+from play_tune_multi import DroneFilter, load_show, prepare_swarm, show_drones, start_swarm
+
+log = logging.getLogger(__name__)
+
+HOST = "127.0.0.1"
+PORT = 14650
+HEARTBEAT_INTERVAL = 1.0
+# a connection that heard from its drone before and has been silent for this
+# many seconds is reopened
+LINK_TIMEOUT = 5.0
+# seconds between play and the start of a cued show
+START_DELAY = 0.01
+
+
+class PooledConnection:
+    def __init__(self, link):
+        self.link = link
+        self.conn = connect(link)
+        self.last_heard = None
+        self.reconnects = 0
+
+    def reopen(self):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        self.conn = connect(self.link)
+        self.last_heard = None
+        self.reconnects += 1
+
+    def heartbeat(self, now, in_use=False):
+        """
+        Sends a HEARTBEAT and drains what the drone sent meanwhile. Both do
+        not block. Reopens the connection if the link failed or went silent,
+        unless it is in use by the playing show, which holds on to it.
+        """
+        try:
+            self.conn.mav.heartbeat_send(mavlink.MAV_TYPE_GCS, mavlink.MAV_AUTOPILOT_INVALID, 0, 0, 0)
+            while self.conn.recv_msg() is not None:
+                self.last_heard = now
+        except OSError as e:
+            problem = f"failed ({e})"
+        else:
+            if self.last_heard is None or now - self.last_heard <= LINK_TIMEOUT:
+                return
+            problem = f"silent for {now - self.last_heard:.1f} sec"
+        if in_use:
+            log.warning("%s %s, reconnecting after the show", self.link, problem)
+            return
+        log.warning("%s %s, reconnecting", self.link, problem)
+        self.reopen()
+
+
+class ConnectionPool:
+    """
+    Warm MAVLink connections keyed by endpoint. get() is safe to call from
+    worker threads, heartbeat() runs on the event loop.
+    """
+
+    def __init__(self):
+        self._connections = dict()
+        self._lock = threading.Lock()
+        self._holds = 0
+        self._in_use = Counter()
+
+    @contextlib.contextmanager
+    def hold(self):
+        """
+        Pauses the heartbeats while worker threads use the connections to
+        wait for answers of the drones.
+        """
+        with self._lock:
+            self._holds += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._holds -= 1
+
+    def get(self, link):
+        """
+        Returns the connection to link, opening it on first use.
+        """
+        with self._lock:
+            pooled = self._connections.get(link)
+            if pooled is None:
+                log.info("opening %s", link)
+                pooled = self._connections[link] = PooledConnection(link)
+            return pooled.conn
+
+    @contextlib.contextmanager
+    def use(self, links):
+        """
+        Marks the connections to links as in use, they are not reopened
+        until the block is left.
+        """
+        with self._lock:
+            self._in_use.update(links)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use.subtract(links)
+
+    def heartbeat(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._holds:
+                return
+            for link, pooled in self._connections.items():
+                pooled.heartbeat(now, in_use=self._in_use[link] > 0)
+
+    async def keep_warm(self, interval=HEARTBEAT_INTERVAL):
+        while True:
+            self.heartbeat()
+            await asyncio.sleep(interval)
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            return {link: {"heard": None if pooled.last_heard is None else round(now - pooled.last_heard, 3),
+                           "reconnects": pooled.reconnects}
+                    for link, pooled in self._connections.items()}
+
+    def close(self):
+        with self._lock:
+            for pooled in self._connections.values():
+                pooled.conn.close()
+            self._connections.clear()
+
+
+class Player:
+    """
+    Holds the cued show and the running one, and executes the commands of
+    the clients.
+    """
+
+    def __init__(self, pool, lead_time=LEAD_TIME, start_delay=START_DELAY, sync=False):
+        self.pool = pool
+        self.lead_time = lead_time
+        self.start_delay = start_delay
+        self.sync = sync
+        self.cued = None  # (filename, show, drones, prepared)
+        self.playing = None  # (filename, task, show)
+
+    async def cue(self, show):
+        filename = os.path.abspath(show)
+        loaded = await asyncio.to_thread(load_show, filename)
+        drones = show_drones(loaded)
+        try:
+            with self.pool.hold():
+                prepared = await prepare_swarm(drones, self.sync, self.pool.get)
+        except BaseException:
+            loaded.close()
+            raise
+        self._uncue()
+        self.cued = (filename, loaded, drones, prepared)
+        log.info("cued %s, %d drones", filename, len(drones))
+        return {"cued": filename, "drones": len(drones)}
+
+    def _uncue(self):
+        # the playing show is closed once it finishes
+        if self.cued is not None and (self.playing is None or self.playing[2] is not self.cued[1]):
+            self.cued[1].close()
+        self.cued = None
+
+    async def play(self, show=None):
+        if show is not None and (self.cued is None or self.cued[0] != os.path.abspath(show)):
+            await self.cue(show)
+        if self.cued is None:
+            raise ValueError("no show cued")
+        if not all(self.pool.get(drone.link) is conn for drone, (conn, latency) in zip(self.cued[2], self.cued[3])):
+            log.info("links reconnected since the show was cued, cueing it again")
+            await self.cue(self.cued[0])
+        await self.stop()
+        filename, loaded, drones, prepared = self.cued
+        task = asyncio.create_task(self._play(drones, prepared))
+        task.add_done_callback(lambda task: self._finished(filename, task, loaded))
+        self.playing = (filename, task, loaded)
+        return {"playing": filename}
+
+    async def _play(self, drones, prepared):
+        with self.pool.use({drone.link for drone in drones}):
+            return await start_swarm(drones, prepared, self.lead_time, self.start_delay)
+
+    def _finished(self, filename, task, loaded):
+        if self.playing is not None and self.playing[1] is task:
+            self.playing = None
+        if self.cued is None or self.cued[1] is not loaded:
+            loaded.close()
+        if not task.cancelled() and task.exception() is not None:
+            log.error("%s failed: %s", filename, task.exception())
+        else:
+            log.info("%s %s", filename, "stopped" if task.cancelled() else "finished")
+
+    async def stop(self):
+        if self.playing is None:
+            return {"stopped": None}
+        filename, task, loaded = self.playing
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return {"stopped": filename}
+
+    async def status(self):
+        return {"cued": self.cued and self.cued[0], "playing": self.playing and self.playing[0],
+                "links": self.pool.status()}
+
+    async def execute(self, request):
+        command = request.get("command")
+        if command == "cue":
+            return await self.cue(request["show"])
+        if command == "play":
+            return await self.play(request.get("show"))
+        if command == "stop":
+            return await self.stop()
+        if command == "status":
+            return await self.status()
+        raise ValueError(f"unknown command {command!r}")
+
+
+async def handle_client(player, reader, writer):
+    try:
+        while line := await reader.readline():
+            try:
+                response = {"ok": True, **await player.execute(json.loads(line))}
+            except Exception as e:
+                log.debug("command %r failed", line, exc_info=True)
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(host=HOST, port=PORT, **options):
+    pool = ConnectionPool()
+    player = Player(pool, **options)
+    warm = asyncio.create_task(pool.keep_warm())
+    server = await asyncio.start_server(lambda reader, writer: handle_client(player, reader, writer), host, port)
+    log.info("listening on %s:%d", host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        warm.cancel()
+        await player.stop()
+        player._uncue()
+        pool.close()
+
+
+def request(command, host=HOST, port=PORT, **arguments):
+    """
+    Sends one command to the daemon and returns its answer.
+    """
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(json.dumps({"command": command, **arguments}).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Resident MML player with warm MAVLink connections.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the daemon")
+    serve_parser.add_argument("-v", "--verbose", action="store_true", help="log every segment")
+    serve_parser.add_argument("-q", "--quiet", action="store_true", help="log warnings and errors only")
+    serve_parser.add_argument("--lead-time", type=float, default=LEAD_TIME,
+                              help="send every segment this many seconds ahead of its deadline "
+                                   "(default: %(default)s)")
+    serve_parser.add_argument("--start-delay", type=float, default=START_DELAY,
+                              help="seconds between play and the start of the show (default: %(default)s)")
+    serve_parser.add_argument("--sync", action="store_true",
+                              help="measure every link with TIMESYNC when cueing and compensate its latency")
+    cue_parser = commands.add_parser("cue", help="load a show and connect its drones")
+    cue_parser.add_argument("show", help="JSON show config or compiled show file")
+    play_parser = commands.add_parser("play", help="play the cued show, or cue and play another one")
+    play_parser.add_argument("show", nargs="?")
+    commands.add_parser("stop", help="stop the running show")
+    commands.add_parser("status", help="print the cued and running show and the links")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "serve":
+        level = logging.DEBUG if args.verbose else logging.WARNING if args.quiet else logging.INFO
+        logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(drone)s: %(message)s")
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(DroneFilter())
+        try:
+            asyncio.run(serve(args.host, args.port, lead_time=args.lead_time, start_delay=args.start_delay,
+                              sync=args.sync))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    arguments = dict()
+    if getattr(args, "show", None):
+        # the daemon may run in another directory
+        arguments["show"] = os.path.abspath(args.show)
+    try:
+        response = request(args.command, args.host, args.port, **arguments)
+    except OSError as e:
+        print(f"cannot reach the daemon on {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(response, indent=2))
+    return 0 if response.get("ok") else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
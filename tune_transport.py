@@ -0,0 +1,161 @@
+"""
+Transport of MML segments to the drones.
+
+Legacy PLAY_TUNE only takes short tunes, so long melodies are cut into many
+segments, each repeating the tempo and volume prefix. Firmware that
+understands PLAY_TUNE_V2 takes up to 248 characters per message. A
+TuneTransport asks its drone once for SUPPORTED_TUNES (requested with
+MAV_CMD_REQUEST_MESSAGE) and sends PLAY_TUNE_V2 if the drone reports the
+QBasic 1.1 format, legacy PLAY_TUNE otherwise. Drones that do not answer, and
+pymavlink dialects without the messages, get legacy PLAY_TUNE.
+
+The players use transport_for(conn, target_system, target_component), which
+keeps one transport per connection and target, so every drone is only asked
+once. Several drones can share one connection (a telemetry radio or router
+in front of the swarm), each with its own transport:
+
+    transport = transport_for(conn, *target)
+    max_length = transport.max_length(MAX_CHUNK_LENGTH)
+    ...
+    transport.send(payload)
+
+Drones that play the same part at the same time are sent one packet per
+link through a TransportGroup. If the part is played by every drone behind
+a link, the group sends it to all of them at once, with broadcast target
+(0, 0) (see broadcast_transport).
+"""
+import time
+import logging
+import weakref
+import functools
+import operator
+
+from pymavlink.dialects.v20 import common as mavlink
+
+log = logging.getLogger(__name__)
+
+# Not every pymavlink dialect knows the tune messages, the ids are fixed by
+# the MAVLink common message set.
+MSG_ID_SUPPORTED_TUNES = 401
+TUNE_FORMAT_QBASIC1_1 = 1
+PLAY_TUNE_V2_LENGTH = 248
+# (target_system, target_component) of a drone that has not been given one
+DEFAULT_TARGET = (1, 1)
+BROADCAST_TARGET = (0, 0)
+
+# seconds to wait for SUPPORTED_TUNES, and how often to ask
+QUERY_TIMEOUT = 0.5
+QUERY_ATTEMPTS = 2
+
+_transports = weakref.WeakKeyDictionary()
+
+
+class TuneTransport:
+    def __init__(self, conn, target_system=1, target_component=1, timeout=QUERY_TIMEOUT):
+        self.conn = conn
+        self.target_system = target_system
+        self.target_component = target_component
+        self.timeout = timeout
+        self._formats = None
+        self.packets = 0
+
+    @property
+    def formats(self):
+        """
+        TUNE_FORMAT bitmask the drone reported in SUPPORTED_TUNES, 0 if it
+        did not answer. The drone is queried on first use.
+        """
+        if self._formats is None:
+            self._formats = self.query_formats()
+        return self._formats
+
+    def query_formats(self):
+        """
+        Asks the drone for SUPPORTED_TUNES and returns its format bitmask,
+        or 0 if there is no answer.
+        """
+        if not hasattr(self.conn.mav, "play_tune_v2_send"):
+            log.info("pymavlink dialect without PLAY_TUNE_V2, using PLAY_TUNE")
+            return 0
+        for attempt in range(QUERY_ATTEMPTS):
+            self.conn.mav.command_long_send(
+                self.target_system, self.target_component, mavlink.MAV_CMD_REQUEST_MESSAGE, attempt,
+                MSG_ID_SUPPORTED_TUNES, 0, 0, 0, 0, 0, 0)
+            # on a shared link the other drones may still be answering
+            deadline = time.monotonic() + self.timeout
+            while (remaining := deadline - time.monotonic()) > 0:
+                msg = self.conn.recv_match(type="SUPPORTED_TUNES", blocking=True, timeout=remaining)
+                if msg is None:
+                    break
+                if msg.get_srcSystem() == self.target_system:
+                    log.info("system %d supports tune formats %#x", self.target_system, msg.format)
+                    return msg.format
+        log.info("system %d did not report SUPPORTED_TUNES, using PLAY_TUNE", self.target_system)
+        return 0
+
+    @property
+    def v2(self):
+        return bool(self.formats & TUNE_FORMAT_QBASIC1_1)
+
+    def max_length(self, legacy_length):
+        """
+        Returns the longest segment the drone accepts, legacy_length if it
+        only understands PLAY_TUNE.
+        """
+        return PLAY_TUNE_V2_LENGTH if self.v2 else legacy_length
+
+    def send(self, payload):
+        """
+        Sends one encoded MML segment.
+        """
+        log.debug("play tune %r, %d bytes", payload, len(payload))
+        if self.v2:
+            self.conn.mav.play_tune_v2_send(self.target_system, self.target_component,
+                                            TUNE_FORMAT_QBASIC1_1, payload)
+        else:
+            self.conn.mav.play_tune_send(self.target_system, self.target_component, b"", payload)
+        self.packets += 1
+
+
+def transport_for(conn, target_system=1, target_component=1):
+    """
+    Returns the TuneTransport of a connection and target, creating it on
+    first use.
+    """
+    transports = _transports.setdefault(conn, dict())
+    key = (target_system, target_component)
+    if key not in transports:
+        transports[key] = TuneTransport(conn, target_system, target_component)
+    return transports[key]
+
+
+def broadcast_transport(conn, transports):
+    """
+    Returns a transport that reaches all drones behind conn with one packet
+    per segment. It sends in the format all of transports (the transports
+    of these drones) understand, without asking the drones again.
+    """
+    transport = TuneTransport(conn, *BROADCAST_TARGET)
+    transport._formats = functools.reduce(operator.and_, (t.formats for t in transports))
+    return transport
+
+
+class TransportGroup:
+    """
+    Sends every segment through several transports, for drones that play
+    the same part.
+    """
+
+    def __init__(self, transports):
+        self.transports = list(transports)
+
+    def max_length(self, legacy_length):
+        return min(transport.max_length(legacy_length) for transport in self.transports)
+
+    def send(self, payload):
+        for transport in self.transports:
+            transport.send(payload)
+
+    @property
+    def packets(self):
+        return sum(transport.packets for transport in self.transports)